@@ -0,0 +1,259 @@
+import datetime
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+
+# Closed years are frozen into one compressed Parquet file per year
+# (<archive_dir>/<name>/<year>.parquet) and dropped from the cached loaders,
+# so the live path only carries open-year rows. Pages read through ``load``,
+# which skips partitions outside the selected years and unions the rest with
+# the live rows. Each partition records a hash of its rows; when the sheet
+# rows for a frozen year change (a late entry or a correction), the
+# partition is written again on the next load. Tabs registered with
+# ``cachefx.register_tab(archive=...)`` leave frozen years out of their kept
+# frame, so those rows are neither cleaned nor hashed again until they change.
+
+# A year is closed this many days after it ends, so late entries still make it in
+ROLLOVER_GRACE_DAYS = 31
+
+_HASH_KEY = b"anjo_rows_hash"
+
+_lock = threading.Lock()
+
+# archive name -> (loader, date column, finish)
+_archives = {}
+
+# path -> (mtime_ns, frame)
+_partitions = {}
+
+# path -> (mtime_ns, rows hash)
+_hashes = {}
+
+# archive name -> (source, years found up to date for it), see freeze_closed_years
+_checked = {}
+
+
+def get_archive_dir() -> Path:
+    return Path(st.secrets.get("archive_dir", ".anjo_archive"))
+
+
+def _partition_path(name: str, year: int) -> Path:
+    return get_archive_dir() / name / f"{year}.parquet"
+
+
+def register(name: str, loader, date_column: str = "Date", finish=None):
+    """Archive a cached loader's frame by year. ``finish`` runs on the union
+    (e.g. to re-sort). Modules register at import, like sqlfx.register_table."""
+    _archives[name] = (loader, date_column, finish)
+
+
+def get_name(loader):
+    """Archive name of a registered loader, or None."""
+    for name, (archived_loader, _, _) in _archives.items():
+        if archived_loader is loader:
+            return name
+    return None
+
+
+def get_archived_years(name):
+    if name is None:
+        return []
+    directory = get_archive_dir() / name
+    if not directory.is_dir():
+        return []
+    return sorted(int(path.stem) for path in directory.glob("*.parquet") if path.stem.isdigit())
+
+
+def get_last_closed_year(today=None) -> int:
+    today = today or datetime.date.today()
+    return (today - datetime.timedelta(days=ROLLOVER_GRACE_DAYS)).year - 1
+
+
+def _years(frame, date_column):
+    return pd.to_datetime(frame[date_column], errors="coerce").dt.year
+
+
+def get_years(name: str, frame):
+    """Year of each row of ``frame``, by the archive's date column (NaN if unparsable)."""
+    return _years(frame, _archives[name][1])
+
+
+def read_partition(name: str, year: int):
+    path = _partition_path(name, year)
+    mtime_ns = path.stat().st_mtime_ns
+
+    with _lock:
+        cached = _partitions.get(path)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1]
+
+    frame = pd.read_parquet(path)
+
+    with _lock:
+        _partitions[path] = (mtime_ns, frame)
+
+    return frame
+
+
+def _rows_hash(frame):
+    # Ignores the index and row order, so a renumbered frame with the same rows matches
+    try:
+        return str(int(pd.util.hash_pandas_object(frame, index=False).sum()))
+    except TypeError:
+        return None
+
+
+def _read_hash(name: str, year: int):
+    path = _partition_path(name, year)
+    mtime_ns = path.stat().st_mtime_ns
+
+    with _lock:
+        cached = _hashes.get(path)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1]
+
+    rows_hash = (pq.read_schema(path).metadata or {}).get(_HASH_KEY, b"").decode() or None
+
+    with _lock:
+        _hashes[path] = (mtime_ns, rows_hash)
+
+    return rows_hash
+
+
+def is_current(name: str, year: int, rows) -> bool:
+    """Whether the partition of ``year`` holds exactly ``rows``."""
+    if year not in get_archived_years(name):
+        return False
+    rows_hash = _rows_hash(rows)
+    return rows_hash is not None and _read_hash(name, year) == rows_hash
+
+
+def _write_partition(name: str, year: int, frame, rows_hash):
+    path = _partition_path(name, year)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    table = pa.Table.from_pandas(frame)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), _HASH_KEY: (rows_hash or "").encode()})
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        pq.write_table(table, tmp_path, compression="zstd")
+        os.chmod(tmp_path, 0o444)
+        os.replace(tmp_path, path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+
+def freeze_closed_years(name: str, frame, source=None):
+    """Write a partition for every closed year of ``frame`` that is not archived
+    yet or whose rows changed since, and return the rows that stay live.
+    Call it at the end of the registered loader.
+
+    ``source`` identifies the sheet rows behind ``frame`` (e.g. tab versions,
+    see cachefx.get_tab_version). While it stays the same, years found up to
+    date before are not hashed again.
+    """
+    if frame.empty:
+        return frame
+
+    date_column = _archives[name][1]
+    years = _years(frame, date_column)
+    archived = set(get_archived_years(name))
+    with _lock:
+        checked_source, checked = _checked.get(name, (None, frozenset()))
+    if source is None or source != checked_source:
+        checked = frozenset()
+
+    for year in sorted(set(years.dropna().astype(int))):
+        if year > get_last_closed_year() or (year in checked and year in archived):
+            continue
+
+        rows = frame[years == year]
+        rows_hash = _rows_hash(rows)
+        if year in archived and (rows_hash is None or _read_hash(name, year) == rows_hash):
+            continue
+
+        try:
+            _write_partition(name, year, rows, rows_hash)
+        except (OSError, pa.ArrowException, ValueError, TypeError):
+            # Not writable or not storable as Parquet: a new year just stays live
+            continue
+        archived.add(year)
+
+    if source is not None:
+        with _lock:
+            _checked[name] = (source, frozenset(archived))
+
+    return frame[~years.isin(archived)]
+
+
+def _drop_archived(name: str, frame):
+    # A process still serving a frame cached before a rollover must not count those rows twice
+    archived = get_archived_years(name)
+    if frame.empty or not archived:
+        return frame
+    return frame[~_years(frame, _archives[name][1]).isin(archived)]
+
+
+def live_rows(loader, ctx=None):
+    """The loader's own rows that still come from the sheet, indexed by sheet
+    row - 2 (e.g. the ones gfx.show_record_editor may write back to)."""
+    frame = ctx.load(loader) if ctx is not None else loader()
+    name = get_name(loader)
+    return _drop_archived(name, frame) if name is not None else frame
+
+
+def load(loader, years=None, ctx=None):
+    """Return a loader's frame for the selected years (all by default).
+
+    Archived years outside the selection are never read, and the live loader
+    is skipped altogether when every selected year is archived. The result
+    keeps the live frame's ``attrs["as_of"]``.
+    """
+    name = get_name(loader)
+    if name is None:
+        return ctx.load(loader) if ctx is not None else loader()
+
+    archived = get_archived_years(name)
+    live, attrs = None, {}
+    if not years or any(year not in archived for year in years):
+        live = ctx.load(loader) if ctx is not None else loader()
+        attrs = dict(live.attrs)
+        live = _drop_archived(name, live)
+        # The loader may just have frozen a year that closed since
+        archived = get_archived_years(name)
+
+    parts = [read_partition(name, year) for year in archived if not years or year in years]
+    parts = [part for part in parts if not part.empty]
+    frozen = pd.concat(parts) if parts else None
+    if frozen is not None and live is not None and (
+        frozen.index.has_duplicates or frozen.index.isin(live.index).any()
+    ):
+        # Frozen rows keep the sheet rows they had when frozen, which rows
+        # deleted since may have handed to live ones: move them below row 0,
+        # in order, so the live rows keep their sheet-row index
+        frozen.index = pd.RangeIndex(-len(frozen), 0)
+
+    frames = [part for part in (frozen, live) if part is not None and not part.empty]
+    if not frames:
+        frame = live.copy() if live is not None else read_partition(name, archived[0]).iloc[:0].copy()
+        frame.attrs = attrs
+        return frame
+
+    frame = pd.concat(frames)
+    if frame.index.has_duplicates:
+        # Indexes that are not sheet rows (e.g. an already renumbered loader)
+        frame = frame.reset_index(drop=True)
+    else:
+        frame = frame.sort_index()
+
+    finish = _archives[name][2]
+    frame = finish(frame) if finish is not None else frame
+    frame.attrs = attrs
+    return frame
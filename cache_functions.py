@@ -0,0 +1,774 @@
+import functools
+import threading
+import time
+from collections import deque
+from typing import Callable, NamedTuple, Optional
+
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+import archive_functions as arcfx
+import mirror_functions as mfx
+import sheets_functions as shfx
+import snapshot_functions as snapfx
+import storage_functions as storefx
+
+# Seconds a loaded dataset is reused before its sheet is read again.
+# Any of these can be overridden with a [cache_ttl] table in secrets.toml.
+DEFAULT_TTLS = {
+    "costs": 600,
+    "sales": 300,
+    "deposits": 600,
+    "withdraws": 600,
+    "customers": 900,
+    "harvests": 300,
+}
+
+_lock = threading.RLock()
+
+# (dataset, loader, args, kwargs) -> (loaded_at, value, as_of)
+_entries = {}
+
+# key -> (published Arrow table of its entry, the table as a pandas frame)
+_frames = {}
+
+# Bumped on every invalidation so a load that started before a write cannot
+# store its (now stale) result after the write invalidated the dataset
+_generations = {}
+
+# Keys this process has loaded itself, and keys being reloaded in the background
+_loaded = set()
+_reloading = set()
+
+# dataset -> wall-clock time of its last invalidation; published versions
+# older than that are not adopted
+_invalidated_at = {}
+
+# key -> wall-clock time the data being served for it was read from Sheets
+_as_of = {}
+
+# Stale-while-revalidate loaders block once their data is older than this.
+# Also caps how old a published snapshot may be. Overridable with [max_staleness].
+DEFAULT_MAX_STALENESS = 1800
+
+
+# Forms only append, so between full resyncs only rows below the last seen
+# row are read. The periodic full read picks up edits and deletions made by
+# hand; only the rows whose content hash changed are cleaned again.
+FULL_RESYNC_SECONDS = 600
+
+class IncrementalTab(NamedTuple):
+    dataset: str
+    secret_name: str
+    title: str
+    clean: Optional[Callable]
+    finish: Optional[Callable]
+    evaluate_formulas: bool
+    columns: Optional[tuple]
+    tombstones: bool
+    archive: Optional[str]
+    options: dict
+
+
+# (secret name, tab title) -> IncrementalTab
+_tabs = {}
+
+# (secret name, tab title) -> {"header", "columns", "rows", "hashes", "frame", "left_out", "deleted", "synced_at",
+# "fetched_at", "read_at", "generation"}; "left_out" maps the frame index of each row left out for a frozen year
+# to that year, and "read_at" is when the last read's rows were read from Sheets (a mirror may be older)
+_increments = {}
+_workbook_locks = {}
+
+# (secret name, tab title) -> [callback(added, removed, replace)], see add_listener
+_listeners = {}
+
+# (secret name, tab title) -> number of changes seen, see get_tab_version
+_tab_versions = {}
+
+# Rows are voided rather than deleted, so row numbers never shift: a tab
+# registered with ``tombstones=True`` hides rows whose Status cell says
+# "deleted". The columns are added to the header on the first void.
+TOMBSTONE_COLUMNS = ("Status", "Deleted At")
+DELETED_STATUS = "deleted"
+
+
+def get_ttl(dataset: str) -> float:
+    overrides = st.secrets.get("cache_ttl", {})
+    return float(overrides.get(dataset, DEFAULT_TTLS.get(dataset, 300)))
+
+
+def get_max_staleness(dataset: str) -> float:
+    overrides = st.secrets.get("max_staleness", {})
+    return float(overrides.get(dataset, DEFAULT_MAX_STALENESS))
+
+
+def copy_result(value):
+    # Pages add columns and reformat dates in place, so never hand out the cached object
+    if isinstance(value, pa.Table):
+        return value.to_pandas()
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy()
+    if isinstance(value, list):
+        return list(value)
+    return value
+
+
+def _shared_value(key, value):
+    # A published Arrow table is converted to pandas once per version, not per call
+    if not isinstance(value, pa.Table):
+        return value
+
+    with _lock:
+        table, frame = _frames.get(key, (None, None))
+    if table is not value:
+        frame = value.to_pandas()
+        with _lock:
+            _frames[key] = (value, frame)
+    return frame
+
+
+def _serve(key, entry, copy=True):
+    # The read time travels with the frame, so a caller never pairs it with
+    # the time of a reload that finished in between (see ``as_of``), and
+    # with the result of an outer loader being built from this one
+    shfx.note_read_at(entry[2])
+    result = _shared_value(key, entry[1])
+    if copy:
+        result = copy_result(result)
+    if isinstance(result, pd.DataFrame):
+        result.attrs["as_of"] = entry[2]
+    return result
+
+
+def cached(
+    dataset: str, snapshot: Optional[int] = None, stale_while_revalidate: bool = False, schema: Optional[dict] = None
+):
+    """Cache a loader's result in-process for the dataset's TTL.
+
+    Every loader reading the same worksheet should use the same dataset name,
+    so that ``invalidate(dataset)`` after a write clears all of them at once.
+
+    ``snapshot`` is the schema version of the loader's DataFrame; when given,
+    every result is published as a memory-mapped Arrow file (see snapfx) and
+    kept only in that form. Other processes adopt a newer published version
+    instead of reading Sheets, and a freshly started process serves it
+    straight away, reloading in the background if it is past its TTL.
+    Bump it whenever the cleaned columns change.
+
+    With ``stale_while_revalidate`` an expired result is still returned at
+    once while a background reload runs, until it is older than the
+    dataset's maximum staleness; then the call waits for the reload.
+    A DataFrame result carries the time its data was read from Sheets in
+    ``frame.attrs["as_of"]``: the oldest read behind it, mirror files and
+    kept tab rows included. ``wrapper.as_of(*args)`` gives the same for the
+    result held now.
+
+    ``wrapper.shared(*args)`` returns the held result itself rather than a
+    copy, for callers that copy it themselves (ctxfx) and never change it.
+
+    ``schema`` ({column: dtype}) declares the columns of the loader's frame;
+    ``wrapper.empty()`` returns an empty frame with them, which pages are
+    given when the load fails (see ctxfx.DatasetContext.load).
+    """
+
+    def decorator(loader):
+        loader_name = f"{loader.__module__}.{loader.__qualname__}"
+
+        def make_key(args, kwargs):
+            return dataset, loader_name, args, tuple(sorted(kwargs.items()))
+
+        def load(key, args, kwargs):
+            with _lock:
+                generation = _generations.get(dataset, 0)
+
+            # Every read the loader makes, directly or through other loaders, notes its time
+            times = []
+            outer_times = shfx.track_read_times(times)
+            started = time.time()
+            try:
+                value = loader(*args, **kwargs)
+            finally:
+                shfx.track_read_times(outer_times)
+            as_of = min(times, default=started)
+
+            with _lock:
+                if _generations.get(dataset, 0) != generation:
+                    return time.monotonic(), value, as_of
+
+            if snapshot is not None:
+                # Publish for the other processes and keep the shared mapping
+                # rather than a private copy
+                try:
+                    published = snapfx.write_snapshot(_snapshot_name(key), snapshot, value, as_of)
+                    if published is not None:
+                        value = published
+                except (OSError, pa.ArrowException):
+                    pass
+
+            entry = (time.monotonic(), value, as_of)
+            with _lock:
+                if _generations.get(dataset, 0) == generation:
+                    _entries[key] = entry
+                    _as_of[key] = as_of
+                    _loaded.add(key)
+
+            return entry
+
+        def adopt_published(key, entry):
+            # A version published by another process (or a previous run of this
+            # one) that is newer than what we hold and than our last write
+            stored = snapfx.read_snapshot(_snapshot_name(key), snapshot)
+            if stored is None:
+                return None
+            table, written_at = stored
+
+            with _lock:
+                held_as_of = _as_of.get(key, 0) if entry is not None else 0
+                if written_at <= max(held_as_of, _invalidated_at.get(dataset, 0)):
+                    return None
+                entry = _entries[key] = (time.monotonic() - (time.time() - written_at), table, written_at)
+                _as_of[key] = written_at
+
+            return entry
+
+        def reload(key, args, kwargs):
+            try:
+                load(key, args, kwargs)
+            except Exception:
+                # Keep serving what we have; the next call starts another reload
+                pass
+            finally:
+                with _lock:
+                    _reloading.discard(key)
+
+        def start_reload(key, args, kwargs):
+            with _lock:
+                if key in _reloading:
+                    return
+                _reloading.add(key)
+            threading.Thread(target=reload, args=(key, args, kwargs), daemon=True).start()
+
+        @functools.wraps(loader)
+        def get_entry(key, args, kwargs):
+            with _lock:
+                entry = _entries.get(key)
+
+            if entry is not None and time.monotonic() - entry[0] < get_ttl(dataset):
+                return entry
+
+            if snapshot is not None:
+                entry = adopt_published(key, entry) or entry
+                if entry is not None and time.monotonic() - entry[0] < get_ttl(dataset):
+                    return entry
+
+            if entry is not None and time.time() - entry[2] < get_max_staleness(dataset):
+                # Never loaded by this process yet (e.g. just restarted): show
+                # the published version rather than make the first user wait
+                if stale_while_revalidate or key not in _loaded:
+                    start_reload(key, args, kwargs)
+                    return entry
+
+            return load(key, args, kwargs)
+
+        @functools.wraps(loader)
+        def wrapper(*args, **kwargs):
+            key = make_key(args, kwargs)
+            return _serve(key, get_entry(key, args, kwargs))
+
+        def shared(*args, **kwargs):
+            key = make_key(args, kwargs)
+            return _serve(key, get_entry(key, args, kwargs), copy=False)
+
+        def as_of(*args, **kwargs):
+            with _lock:
+                return _as_of.get(make_key(args, kwargs))
+
+        def empty():
+            return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in (schema or {}).items()})
+
+        wrapper.uncached = loader
+        wrapper.shared = shared
+        wrapper.dataset = dataset
+        wrapper.as_of = as_of
+        wrapper.empty = empty
+        return wrapper
+
+    return decorator
+
+
+def _snapshot_name(key) -> str:
+    dataset, loader_name, args, kwargs = key
+    return "__".join([dataset, loader_name] + [repr(arg) for arg in args + kwargs])
+
+
+def invalidate(dataset: str, full: bool = False):
+    """Forget every cached result of a dataset, e.g. right after writing to it.
+
+    The incremental row cursor is kept, so the next load only reads the
+    appended rows. Pass ``full=True`` to force a complete re-read. The local
+    mirror of the dataset is bypassed until it has been re-downloaded.
+    """
+    mfx.refresh(dataset)
+
+    with _lock:
+        _generations[dataset] = _generations.get(dataset, 0) + 1
+        for key in [key for key in _entries if key[0] == dataset]:
+            del _entries[key]
+            _frames.pop(key, None)
+        # Published snapshots predate the write, so don't adopt them either
+        _invalidated_at[dataset] = time.time()
+        for key in [key for key in _as_of if key[0] == dataset]:
+            del _as_of[key]
+        if full:
+            for key in [key for key, tab in _tabs.items() if tab.dataset == dataset]:
+                _increments.pop(key, None)
+
+
+def invalidate_all(full: bool = False):
+    with _lock:
+        for dataset in set(key[0] for key in _entries) | set(DEFAULT_TTLS):
+            _generations[dataset] = _generations.get(dataset, 0) + 1
+        _entries.clear()
+        _frames.clear()
+        for dataset in DEFAULT_TTLS:
+            _invalidated_at[dataset] = time.time()
+        _as_of.clear()
+        if full:
+            _increments.clear()
+
+
+def register_tab(
+    dataset, secret_name, title, clean=None, finish=None, evaluate_formulas=False, columns=None,
+    tombstones=False, archive=None, **options
+):
+    """Declare an append-only tab that loaders read through ``load_tab``.
+
+    ``clean`` turns raw rows into the dataset's frame and must work row by
+    row, since it also runs on just the appended rows; ``finish`` runs on the
+    combined frame (e.g. to re-sort). ``columns`` lists the header names
+    ``clean`` needs; once resolved against the header, only those columns
+    are fetched. With ``tombstones`` voided rows (see TOMBSTONE_COLUMNS) are
+    left out of the tab's frame; ``clean`` never sees those columns. With
+    ``archive`` (an arcfx archive of the loader that returns this tab) rows
+    of years frozen in it are left out of the kept frame. ``options`` go to
+    the TextParser, like get_as_dataframe's keyword
+    arguments. Modules register their tabs at import.
+    """
+    _tabs[(secret_name, title)] = IncrementalTab(
+        dataset, secret_name, title, clean, finish, evaluate_formulas,
+        tuple(columns) if columns is not None else None, tombstones, archive, options,
+    )
+
+
+def add_listener(secret_name, title, callback):
+    """Call ``callback(added, removed, replace)`` with cleaned rows every time a tab changes.
+
+    ``replace`` is True when the tab was cleaned from scratch (``added`` is
+    the whole tab, ``removed`` is None). Otherwise ``added`` holds the new
+    and edited rows and ``removed`` the deleted rows and the old versions of
+    the edited ones, so derived indexes can be kept without rescanning the tab.
+    """
+    _listeners.setdefault((secret_name, title), []).append(callback)
+
+
+def get_tab_version(secret_name, title) -> int:
+    """A number that changes whenever the rows of a tab do (e.g. for arcfx.freeze_closed_years's ``source``)."""
+    with _lock:
+        return _tab_versions.get((secret_name, title), 0)
+
+
+def _notify(secret_name, title, added, removed, replace):
+    with _lock:
+        _tab_versions[(secret_name, title)] = _tab_versions.get((secret_name, title), 0) + 1
+    for callback in _listeners.get((secret_name, title), []):
+        callback(added, removed, replace)
+
+
+def _is_fresh(tab, state) -> bool:
+    return (
+        state is not None
+        and state["generation"] == _generations.get(tab.dataset, 0)
+        and time.monotonic() - state["fetched_at"] < get_ttl(tab.dataset)
+    )
+
+
+def _is_tombstone_column(name) -> bool:
+    return str(name).strip().casefold() in (column.casefold() for column in TOMBSTONE_COLUMNS)
+
+
+def _to_frame(tab, values):
+    if tab.tombstones and values and any(_is_tombstone_column(name) for name in values[0]):
+        width = max(len(row) for row in values)
+        values = shfx.project_columns(
+            values, [i for i in range(width) if i >= len(values[0]) or not _is_tombstone_column(values[0][i])]
+        )
+    frame = shfx.values_to_frame(values, **tab.options)
+    return tab.clean(frame) if tab.clean is not None else frame
+
+
+def _find_deleted(tab, header, rows, first_index=0):
+    """Frame indexes of the voided rows among ``rows``, the first of which has index ``first_index``."""
+    names = [str(name).strip().casefold() for name in header]
+    if not tab.tombstones or TOMBSTONE_COLUMNS[0].casefold() not in names:
+        return frozenset()
+
+    status = names.index(TOMBSTONE_COLUMNS[0].casefold())
+    return frozenset(
+        first_index + position
+        for position, row in enumerate(rows)
+        if status < len(row) and str(row[status]).strip().casefold() == DELETED_STATUS
+    )
+
+
+def _visible(frame, deleted):
+    return frame.loc[~frame.index.isin(list(deleted))] if deleted else frame
+
+
+def _resolve_columns(tab, header):
+    """Positions of the tab's declared columns in a full header, or None to keep every column."""
+    if tab.columns is None:
+        return None
+
+    positions = {}
+    for position, name in enumerate(header):
+        positions.setdefault(str(name).strip().casefold(), position)
+
+    wanted = [positions.get(name.strip().casefold()) for name in tab.columns]
+    if None in wanted:
+        # A renamed or missing column: fetch the whole tab and let the cleaner complain
+        return None
+
+    if tab.tombstones:
+        wanted += [positions[name.casefold()] for name in TOMBSTONE_COLUMNS if name.casefold() in positions]
+    return wanted
+
+
+def _hash_rows(rows):
+    return [hash(tuple(row)) for row in rows]
+
+
+def _apply_changes(tab, state, values):
+    """Fold a full re-read into the kept frame, cleaning only inserted and edited rows.
+
+    Rows are matched on their content hash, so rows that merely moved (because
+    a row above was inserted or deleted) are reused and just re-indexed, and
+    so are the rows left out for a frozen year. Returns (frame, hashes, added,
+    removed, left_out, changed_years), ``changed_years`` being the frozen
+    years that lost a row.
+    """
+    hashes = _hash_rows(values[1:])
+    if hashes == state["hashes"]:
+        return state["frame"], hashes, None, None, state["left_out"], set()
+
+    old_positions = {}
+    for position, row_hash in enumerate(state["hashes"]):
+        old_positions.setdefault(row_hash, deque()).append(position)
+
+    moved = {}
+    changed = []
+    for position, row_hash in enumerate(hashes):
+        if old_positions.get(row_hash):
+            moved[old_positions[row_hash].popleft()] = position
+        else:
+            changed.append(position)
+    gone = [position for positions in old_positions.values() for position in positions]
+
+    frame = state["frame"]
+    kept = frame.loc[frame.index.isin(list(moved))]
+    kept.index = kept.index.map(moved)
+
+    added = _to_frame(tab, [state["header"]] + [values[position + 1] for position in changed])
+    added.index = added.index.map(lambda i: changed[i])
+
+    removed = frame.loc[frame.index.isin(gone)]
+
+    left_out = {moved[i]: year for i, year in state["left_out"].items() if i in moved}
+    changed_years = {year for i, year in state["left_out"].items() if i not in moved}
+
+    return pd.concat([kept, added]).sort_index(), hashes, added, removed, left_out, changed_years
+
+
+def _leave_out_frozen_years(tab, state, values, changed_years=()):
+    """Drop the rows of years frozen in the tab's archive from its kept frame.
+
+    A year is left out once its partition holds exactly the tab's rows for it,
+    so the loader's arcfx.freeze_closed_years never sees (or hashes) them
+    again. A left-out year that changed in the sheet (``changed_years``, or
+    new rows for it in the kept frame) is cleaned again whole from
+    ``values``, the full grid, and kept until it has been frozen again.
+    Returns (state, whether a year was read back).
+    """
+    frame, left_out = state["frame"], state["left_out"]
+    years = arcfx.get_years(tab.archive, frame)
+
+    changed = set(changed_years) | (set(years.dropna().astype(int)) & set(left_out.values()))
+    if changed:
+        index = sorted(
+            set(frame.index[years.isin(changed)]) | {i for i, year in left_out.items() if year in changed}
+        )
+        restored = _to_frame(tab, [state["header"]] + [values[i + 1] for i in index])
+        restored.index = restored.index.map(lambda i: index[i])
+        frame = pd.concat([frame.loc[~years.isin(changed)], restored]).sort_index()
+        left_out = {i: year for i, year in left_out.items() if year not in changed}
+        years = arcfx.get_years(tab.archive, frame)
+
+    left_out = dict(left_out)
+    for year in set(years.dropna().astype(int)) & set(arcfx.get_archived_years(tab.archive)):
+        rows = _visible(frame.loc[years == year], state["deleted"])
+        if arcfx.is_current(tab.archive, year, tab.finish(rows) if tab.finish is not None else rows):
+            left_out.update(dict.fromkeys(frame.index[years == year], year))
+
+    frame = frame.loc[~frame.index.isin(list(left_out))]
+    return dict(state, frame=frame, left_out=left_out), bool(changed)
+
+
+def _all_rows(tab, state):
+    # The visible kept rows and the left-out years, read back from their partitions
+    frozen = [arcfx.read_partition(tab.archive, year) for year in sorted(set(state["left_out"].values()))]
+    return pd.concat(frozen + [_visible(state["frame"], state["deleted"])])
+
+
+def _sync(secret_name, tabs):
+    """Bring the kept frames of several tabs of one workbook up to date with one batch read.
+
+    Tabs with declared columns are read whole the first time, to find where
+    those columns are, and only those columns afterwards.
+    """
+    now = time.monotonic()
+    requests = []
+    for tab in tabs:
+        state = _increments.get((secret_name, tab.title))
+        columns = state["columns"] if state is not None else None
+        if state is None or now - state["synced_at"] > FULL_RESYNC_SECONDS:
+            requests.append((tab.title, 1, columns))
+        else:
+            requests.append((tab.title, state["rows"] + 1, columns))
+
+    with _lock:
+        generations = {tab.dataset: _generations.get(tab.dataset, 0) for tab in tabs}
+
+    times = []
+    outer_times = shfx.track_read_times(times)
+    started = time.time()
+    try:
+        grids = storefx.read_values_batch(secret_name, requests, tabs[0].evaluate_formulas)
+    finally:
+        shfx.track_read_times(outer_times)
+    read_at = min(times, default=started)
+
+    moved = []
+    reread = []
+    for tab, (_, start_row, columns), values in zip(tabs, requests, grids):
+        state = _increments.get((secret_name, tab.title))
+        if state is None:
+            columns = _resolve_columns(tab, values[0] if values else [])
+            values = shfx.project_columns(values, columns)
+        header = values[0] if values else []
+
+        if start_row == 1 and columns is not None and state is not None and header != state["header"]:
+            # Columns were inserted or moved in the sheet; re-read the tab whole
+            moved.append(tab)
+            _increments.pop((secret_name, tab.title))
+            continue
+
+        if start_row == 1 and state is not None and header and header == state["header"]:
+            frame, hashes, added, removed, left_out, changed_years = _apply_changes(tab, state, values)
+            old_deleted = state["deleted"]
+            state = dict(
+                state, rows=len(values), hashes=hashes, frame=frame, left_out=left_out,
+                deleted=_find_deleted(tab, header, values[1:]), synced_at=now,
+            )
+            restored = False
+            if tab.archive is not None:
+                state, restored = _leave_out_frozen_years(tab, state, values, changed_years)
+            if restored:
+                # Rows of a frozen year changed: hand the listeners the whole tab again
+                _notify(secret_name, tab.title, _all_rows(tab, state), None, True)
+            elif added is not None:
+                _notify(
+                    secret_name, tab.title,
+                    _visible(added, state["deleted"]), _visible(removed, old_deleted), False,
+                )
+        elif start_row == 1:
+            state = {
+                "header": header,
+                "columns": columns,
+                "rows": len(values),
+                "hashes": _hash_rows(values[1:]),
+                "frame": _to_frame(tab, values),
+                "left_out": {},
+                "deleted": _find_deleted(tab, header, values[1:]),
+                "synced_at": now,
+            }
+            _notify(secret_name, tab.title, _visible(state["frame"], state["deleted"]), None, True)
+            if tab.archive is not None:
+                state, _ = _leave_out_frozen_years(tab, state, values)
+        elif values:
+            new_rows = _to_frame(tab, [state["header"]] + values)
+            new_rows.index = new_rows.index + (start_row - 2)
+            if tab.archive is not None and (
+                set(arcfx.get_years(tab.archive, new_rows).dropna().astype(int)) & set(state["left_out"].values())
+            ):
+                # A late entry for a frozen year: re-read the tab whole, so the year is frozen again complete
+                _increments[(secret_name, tab.title)] = dict(state, synced_at=float("-inf"))
+                reread.append(tab)
+                continue
+            new_deleted = _find_deleted(tab, state["header"], values, start_row - 2)
+            state = dict(
+                state,
+                rows=state["rows"] + len(values),
+                hashes=state["hashes"] + _hash_rows(values),
+                frame=pd.concat([state["frame"], new_rows]),
+                deleted=state["deleted"] | new_deleted,
+            )
+            _notify(secret_name, tab.title, _visible(new_rows, new_deleted), None, False)
+
+        _increments[(secret_name, tab.title)] = dict(
+            state, fetched_at=now, read_at=read_at, generation=generations[tab.dataset]
+        )
+
+    if moved or reread:
+        _sync(secret_name, moved + reread)
+
+
+def load_tab(secret_name, title):
+    """Return the frame of a registered tab, reading only rows appended since the last read.
+
+    The first read (and one every FULL_RESYNC_SECONDS) is a full read. Later
+    ones read ``A{n+1}:`` where n is the row count seen last time and append
+    the cleaned new rows; the frame index stays ``sheet row - 2`` throughout.
+    Other registered tabs of the same workbook that are also due are fetched
+    in the same batchGet, so the next loader of that workbook needs no call.
+    """
+    tab = _tabs[(secret_name, title)]
+
+    with _lock:
+        workbook_lock = _workbook_locks.setdefault(secret_name, threading.Lock())
+
+    with workbook_lock:
+        if not _is_fresh(tab, _increments.get((secret_name, title))):
+            due = [tab] + [
+                other
+                for key, other in _tabs.items()
+                if key[0] == secret_name
+                and other is not tab
+                and other.evaluate_formulas == tab.evaluate_formulas
+                and not _is_fresh(other, _increments.get(key))
+            ]
+            _sync(secret_name, due)
+
+        state = _increments[(secret_name, title)]
+        frame = _visible(state["frame"], state["deleted"]).copy()
+        shfx.note_read_at(state["read_at"])
+
+    return tab.finish(frame) if tab.finish is not None else frame
+
+
+def is_tab_loaded(secret_name, title) -> bool:
+    """Whether this process has read the tab through ``load_tab``, i.e. its listeners have seen its rows."""
+    return (secret_name, title) in _increments
+
+
+def get_sheet_column(secret_name, title, column):
+    """0-based sheet column of a registered tab's header name, for writing cells
+    back; a position (for unnamed columns) is returned as is."""
+    if isinstance(column, int):
+        return column
+
+    state = _increments.get((secret_name, title))
+    if state is None:
+        load_tab(secret_name, title)
+        state = _increments[(secret_name, title)]
+
+    header = [str(name).strip().casefold() for name in state["header"]]
+    position = header.index(column.strip().casefold())
+    return state["columns"][position] if state["columns"] is not None else position
+
+
+def _forget_hashes(hashes, index):
+    # Rows written from here are cleaned from the sheet again at the next full resync
+    hashes = list(hashes)
+    for i in index:
+        if 0 <= i < len(hashes):
+            hashes[i] = None
+    return hashes
+
+
+def _replace_state(tab, secret_name, title, **changes):
+    """Store a locally patched tab state and drop the dataset's cached results,
+    keeping the kept frames current so the next load rebuilds from them
+    instead of reading the sheet. Call with the workbook lock held."""
+    invalidate(tab.dataset)
+    with _lock:
+        generation = _generations[tab.dataset]
+        for key in [key for key, other in _tabs.items() if other.dataset == tab.dataset and key in _increments]:
+            _increments[key] = dict(_increments[key], generation=generation)
+        _increments[(secret_name, title)] = dict(_increments[(secret_name, title)], **changes)
+
+
+def patch_tab(secret_name, title, patches):
+    """Apply cell edits already written to the sheet to the kept frame of a tab,
+    so its dataset's loaders serve them without reading the sheet again.
+
+    ``patches`` maps frame index (sheet row - 2) -> {column: cleaned value}.
+    """
+    tab = _tabs[(secret_name, title)]
+
+    with _lock:
+        workbook_lock = _workbook_locks.setdefault(secret_name, threading.Lock())
+
+    with workbook_lock:
+        state = _increments.get((secret_name, title))
+        if state is None:
+            return
+
+        frame = state["frame"].copy()
+        index = [i for i in patches if i in frame.index]
+        removed = frame.loc[index].copy()
+        for i in index:
+            for column, value in patches[i].items():
+                frame.at[i, column] = value
+
+        _replace_state(tab, secret_name, title, frame=frame, hashes=_forget_hashes(state["hashes"], index))
+
+    _notify(
+        secret_name, title,
+        _visible(frame.loc[index], state["deleted"]), _visible(removed, state["deleted"]), False,
+    )
+
+
+def tombstone_rows(secret_name, title, index, new_columns=None):
+    """Hide rows just voided in the sheet from a tab's loaders without reading it again.
+
+    ``index`` holds frame indexes (sheet row - 2). ``new_columns`` maps the
+    tombstone columns the kept header does not know yet to their 0-based
+    sheet column.
+    """
+    tab = _tabs[(secret_name, title)]
+
+    with _lock:
+        workbook_lock = _workbook_locks.setdefault(secret_name, threading.Lock())
+
+    with workbook_lock:
+        state = _increments.get((secret_name, title))
+        if state is None:
+            return
+
+        header, columns = list(state["header"]), state["columns"]
+        for name, position in sorted((new_columns or {}).items(), key=lambda item: item[1]):
+            if columns is not None:
+                header, columns = header + [name], columns + [position]
+            else:
+                header += [""] * (position - len(header)) + [name]
+
+        removed = _visible(state["frame"].loc[state["frame"].index.isin(list(index))], state["deleted"])
+        _replace_state(
+            tab, secret_name, title,
+            header=header,
+            columns=columns,
+            hashes=_forget_hashes(state["hashes"], index),
+            deleted=state["deleted"] | frozenset(index),
+        )
+
+    _notify(secret_name, title, removed.iloc[:0], removed, False)
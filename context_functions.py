@@ -0,0 +1,201 @@
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import pandas as pd
+import streamlit as st
+
+import cache_functions as cachefx
+import sheets_functions as shfx
+
+# Shared by every session, so a burst of reruns cannot open unbounded connections
+MAX_LOAD_WORKERS = 6
+
+# Seconds a page waits for a prefetched dataset before showing an error for it.
+# Any of these can be overridden with a [load_timeout] table in secrets.toml.
+DEFAULT_TIMEOUTS = {
+    "costs": 30,
+    "sales": 30,
+    "deposits": 30,
+    "withdraws": 30,
+    "customers": 30,
+    "harvests": 60,
+}
+
+_pool = ThreadPoolExecutor(max_workers=MAX_LOAD_WORKERS, thread_name_prefix="anjo-load")
+
+# Loads running on the pool, shared by every session: loader key -> Future
+_lock = threading.Lock()
+_in_flight = {}
+
+# Loader key -> an empty result shaped like its last one (same columns and
+# dtypes), served to the sections when a later load fails
+_empty_results = {}
+
+
+class DatasetLoadTimeout(TimeoutError):
+    """A prefetched dataset did not arrive within its timeout."""
+
+
+def get_timeout(dataset: str) -> float:
+    overrides = st.secrets.get("load_timeout", {})
+    return float(overrides.get(dataset, DEFAULT_TIMEOUTS.get(dataset, 30)))
+
+
+def _loader_key(loader, args):
+    return loader.__module__, loader.__qualname__, tuple(args)
+
+
+def _call(loader, args):
+    # The cached result itself where the loader offers it: load() hands out the copies
+    return loader.shared(*args) if hasattr(loader, "shared") else loader(*args)
+
+
+def _run(counter, loader, *args):
+    # Worker threads count their reads into the requesting run's counter
+    shfx.count_fetches(counter)
+    try:
+        return _call(loader, args)
+    finally:
+        shfx.count_fetches(None)
+
+
+def _submit(counter, loader, args):
+    """Run a loader on the pool, or join the same load if it is already running."""
+    key = _loader_key(loader, args)
+
+    with _lock:
+        future = _in_flight.get(key)
+        if future is None:
+            future = _pool.submit(_run, counter, loader, *args)
+            _in_flight[key] = future
+            future.add_done_callback(lambda _: _forget(key, future))
+
+    return future
+
+
+def _forget(key, future):
+    with _lock:
+        if _in_flight.get(key) is future:
+            del _in_flight[key]
+
+
+def _empty_like(result):
+    if isinstance(result, pd.DataFrame):
+        empty = result.iloc[:0].copy()
+        # Not the data of any particular read
+        empty.attrs.pop("as_of", None)
+        return empty
+    if isinstance(result, list):
+        return []
+    return None
+
+
+def _describe_failure(loader, error) -> str:
+    if isinstance(error, (shfx.SheetsUnavailable, DatasetLoadTimeout)):
+        # Worth retrying as is
+        return f"⚠️ {error}"
+    name = getattr(loader, "dataset", None) or loader.__qualname__
+    return f"⚠️ Could not load {name}: {type(error).__name__}: {error}"
+
+
+def warm_up(*loaders):
+    """Load the given datasets into the cache in the background and return at once.
+
+    Takes the same arguments as ``DatasetContext.prefetch``. Loads already
+    running (from any session) are not started twice.
+    """
+    for spec in loaders:
+        loader, *args = spec if isinstance(spec, tuple) else (spec,)
+        _submit(None, loader, args)
+
+
+class DatasetContext:
+    """Datasets loaded during one script run.
+
+    Create one at the top of a rerun and pass it to the page sections; each
+    loader then runs at most once per rerun however many tabs or widgets need
+    its data. ``remote_fetches`` counts, per tab, the reads that actually went
+    to Google Sheets (cache and mirror hits are not counted).
+    """
+
+    def __init__(self):
+        self._results = {}
+        self._futures = {}
+        self._errors = {}
+        self.remote_fetches = Counter()
+        shfx.count_fetches(self.remote_fetches)
+
+    def prefetch(self, *loaders):
+        """Start the given loaders in parallel on the shared pool.
+
+        Pass loaders, or ``(loader, *args)`` tuples. Nothing is returned: the
+        page still calls ``load`` for each one, which waits for the running
+        fetch instead of starting another, and a load already started by a
+        warm-up or another session is joined. A loader that fails or times out
+        only breaks the sections that load it.
+        """
+        for spec in loaders:
+            loader, *args = spec if isinstance(spec, tuple) else (spec,)
+            key = _loader_key(loader, args)
+            if key not in self._results and key not in self._futures:
+                self._futures[key] = (time.monotonic(), _submit(self.remote_fetches, loader, args))
+
+    def load(self, loader, *args):
+        """Return a loader's result, loading it at most once per run.
+
+        If the load fails or times out, the reason and a Retry button are
+        shown where it was called and an empty result is returned, shaped
+        like the last good one or else like the loader's declared schema
+        (see cachefx.cached), so the rest of the page still renders.
+        """
+        key = _loader_key(loader, args)
+        if key not in self._results:
+            try:
+                if key in self._futures:
+                    self._results[key] = self._wait(loader, key)
+                else:
+                    self._results[key] = _call(loader, args)
+            except Exception as e:
+                # Only the sections needing this dataset go empty, whatever the cause
+                with _lock:
+                    empty = _empty_results.get(key)
+                if empty is None:
+                    empty = loader.empty() if hasattr(loader, "empty") else pd.DataFrame()
+                self._results[key] = empty
+                self._errors[key] = _describe_failure(loader, e)
+                st.warning(self._errors[key])
+                st.button("🔄 Retry", key=f"retry-{loader.__qualname__}")
+            else:
+                with _lock:
+                    _empty_results[key] = _empty_like(self._results[key])
+        elif key in self._errors:
+            # Every section that needs it says why it is empty
+            st.warning(self._errors[key])
+
+        # Sections reformat columns in place, so each one gets its own copy
+        return cachefx.copy_result(self._results[key])
+
+    def _wait(self, loader, key):
+        started_at, future = self._futures[key]
+        dataset = getattr(loader, "dataset", None)
+        timeout = get_timeout(dataset) - (time.monotonic() - started_at)
+        try:
+            # Re-raises the loader's own exception if it failed
+            return future.result(timeout=max(timeout, 0))
+        except TimeoutError:
+            # The fetch keeps running and fills the cache for the next rerun
+            raise DatasetLoadTimeout(
+                f"Loading {dataset or loader.__qualname__} took longer than {get_timeout(dataset):.0f}s"
+            ) from None
+
+    def total_remote_fetches(self) -> int:
+        return sum(self.remote_fetches.values())
+
+    def refetched_tabs(self):
+        """Tabs read from Sheets more than once during this run (should be empty)."""
+        return sorted(title for title, count in self.remote_fetches.items() if count > 1)
+
+    def close(self):
+        shfx.count_fetches(None)
@@ -3,9 +3,11 @@ from typing import List
 
 import pandas as pd
 import streamlit as st
-from gspread_dataframe import get_as_dataframe
 
+import archive_functions as arcfx
+import cache_functions as cachefx
 import general_functions as gfx
+import sql_functions as sqlfx
 
 
 def get_cost_categories():
@@ -45,9 +47,7 @@ def format_date(input_date):
     return formatted_date
 
 
-def load_expense_data(expenses_sheet):
-    expenses_df = get_as_dataframe(expenses_sheet, parse_dates=True)
-
+def clean_expense_df(expenses_df):
     # TODO: Investigate if there is data loss with the dropNa
 
     expenses_df = expenses_df.loc[
@@ -77,6 +77,43 @@ def load_expense_data(expenses_sheet):
     return expenses_df
 
 
+cachefx.register_tab(
+    "costs", "cost_sheet_key", "Costs", clean_expense_df, tombstones=True, archive="costs", parse_dates=True,
+    columns=[
+        "data-bio_data-date",
+        "data-bio_data-item",
+        "data-bio_data-cost_category",
+        "data-bio_data-total_cost",
+    ],
+)
+
+
+@cachefx.cached(
+    "costs", snapshot=1, stale_while_revalidate=True,
+    schema={"Date": "datetime64[ns]", "Item": object, "Cost Category": object, "Total Cost": "float64"},
+)
+def get_expenses_df():
+    return arcfx.freeze_closed_years("costs", cachefx.load_tab("cost_sheet_key", "Costs"))
+
+
+arcfx.register("costs", get_expenses_df)
+
+
+def unformat_column(entry):
+    # Inverse of format_column: "Seeds & Seedlings" -> "seeds_&_seedlings"
+    return "_".join(entry.lower().split())
+
+
+# Record column -> (sheet column, to_cell) for gfx.show_record_editor
+EDITABLE_COLUMNS = {
+    "Date": ("data-bio_data-date", lambda date: date.strftime("%d/%m/%y")),
+    "Item": ("data-bio_data-item", None),
+    "Cost Category": ("data-bio_data-cost_category", unformat_column),
+    "Total Cost": ("data-bio_data-total_cost", None),
+}
+sqlfx.register_table("costs", get_expenses_df, date="Date", category="Cost Category", amount="Total Cost")
+
+
 def process_category(expenses_df, category):
     category_df = expenses_df[expenses_df["Cost Category"] == category]
     category_df = category_df.sort_values(by="Date", ascending=False)
@@ -117,18 +154,12 @@ def filter_data(
         data = data[data["Date"].dt.month.isin(values)]
 
     if filter_name == "start_date":
-        date_string = str(values)
-        formatted_start_date = datetime.datetime.strptime(
-            date_string, "%Y-%m-%d"
-        ).strftime("%d/%m/%Y")
-        data = data[data["Date"] >= formatted_start_date]
+        # Compared as dates, like sqlfx's WHERE clause (not as dd/mm/yyyy text)
+        data = data[data["Date"] >= pd.Timestamp(str(values))]
 
     if filter_name == "end_date":
-        date_string = str(values)
-        formatted_start_date = datetime.datetime.strptime(
-            date_string, "%Y-%m-%d"
-        ).strftime("%d/%m/%Y")
-        data = data[data["Date"] <= formatted_start_date]
+        # The whole end day counts, times included
+        data = data[data["Date"] < pd.Timestamp(str(values)) + pd.Timedelta(days=1)]
 
     return data
 
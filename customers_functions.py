@@ -1,46 +1,36 @@
-import streamlit as st
-import gspread
-from gspread_dataframe import get_as_dataframe, set_with_dataframe
-import pandas as pd
-
-def load_customers():
-    # 1) auth & open sheet
-    sheet_credentials = st.secrets["sheet_credentials"]
-    gc = gspread.service_account_from_dict(sheet_credentials)
-    pepper_workbook = gc.open_by_key(st.secrets["sheet_key"])
-    customers_sheet = pepper_workbook.worksheet("Customers")
-
-    # 2) pull into DataFrame
-    customers_df = get_as_dataframe(customers_sheet, parse_dates=True)
+import bisect
+import threading
+from collections import Counter
 
-    # 3) drop rows where 'name' is missing
-    df = customers_df.dropna(subset=["Name"])
-
-    # 4) extract the 'name' column, strip whitespace, get uniques
-    names = (
-        df["Name"]
-        .astype(str)           # ensure strings
-        .str.strip()           # trim leading/trailing spaces
-        .unique()              # de-duplicate
-        .tolist()              # to list
-    )
+import streamlit as st
 
-    # 5) sort alphabetically, case-insensitive
-    names.sort(key=str.casefold)
+import archive_functions as arcfx
+import cache_functions as cachefx
+import queue_functions as qfx
+import sales_functions as sfx
 
-    return names
+# Customer name index over the Customers directory and the Final Sales history.
+# Kept up to date from the rows each sync reads (see cachefx.add_listener), so
+# listing names never rescans either sheet. Names are deduplicated by casefold;
+# the directory's spelling wins over the one typed on a sale.
+_index_lock = threading.Lock()
+_index_names = {"customers": {}, "sales": {}}  # source -> {casefold: name}
+_index_counts = {"customers": Counter(), "sales": Counter()}  # source -> rows per casefold name
+_index_keys = []  # sorted casefold keys across both sources
+_index_as_of = {"sales": None}  # source -> as_of of the loader result last indexed
 
 
+@cachefx.cached(
+    "customers",
+    schema={"Name": object, "Location": object, "Contact Person": object, "Phone Number": object, "Email": object},
+)
 def load_customers_data():
     """Load full customer data with all attributes."""
-    sheet_credentials = st.secrets["sheet_credentials"]
-    gc = gspread.service_account_from_dict(sheet_credentials)
-    pepper_workbook = gc.open_by_key(st.secrets["sheet_key"])
-    customers_sheet = pepper_workbook.worksheet("Customers")
+    return cachefx.load_tab("sheet_key", "Customers")
 
-    # Pull into DataFrame
-    customers_df = get_as_dataframe(customers_sheet, parse_dates=True)
 
+def clean_customers_df(customers_df):
+    """Reduce raw Customers rows to the expected, trimmed columns."""
     # Drop unnamed columns
     customers_df = customers_df.loc[:, ~customers_df.columns.str.contains('^Unnamed')]
 
@@ -65,17 +55,111 @@ def load_customers_data():
     df["Phone Number"] = df["Phone Number"].astype(str).str.strip().replace('nan', '')
     df["Email"] = df["Email"].astype(str).str.strip().replace('nan', '')
     
-    # Sort alphabetically by name (case-insensitive)
-    df = df.sort_values(by="Name", key=lambda x: x.str.lower())
-    
     return df
 
 
-def display_customers_table():
+def sort_customers_df(df):
+    # Sort alphabetically by name (case-insensitive)
+    return df.sort_values(by="Name", key=lambda x: x.str.lower())
+
+
+cachefx.register_tab(
+    "customers", "sheet_key", "Customers", clean_customers_df,
+    finish=sort_customers_df, parse_dates=True,
+    columns=["Name", "Location", "Contact Person", "Phone Number", "Email"],
+)
+
+
+def _clean_names(names):
+    for name in names:
+        name = str(name).strip()
+        if name not in ("", "nan", "None"):
+            yield name
+
+
+def _index_customer_names(source, added, removed, replace):
+    with _index_lock:
+        if replace:
+            _index_names[source] = {}
+            _index_counts[source] = Counter()
+            _index_keys[:] = sorted(set(_index_names["customers"]) | set(_index_names["sales"]))
+
+        for name in _clean_names(added):
+            key = name.casefold()
+            _index_counts[source][key] += 1
+            if key not in _index_names[source]:
+                _index_names[source][key] = name
+                position = bisect.bisect_left(_index_keys, key)
+                if position == len(_index_keys) or _index_keys[position] != key:
+                    _index_keys.insert(position, key)
+
+        # Rows deleted or edited in the sheet: drop names no row uses any more
+        for name in _clean_names(removed):
+            key = name.casefold()
+            _index_counts[source][key] -= 1
+            if _index_counts[source][key] > 0:
+                continue
+            del _index_counts[source][key]
+            _index_names[source].pop(key, None)
+            if not any(key in names for names in _index_names.values()):
+                position = bisect.bisect_left(_index_keys, key)
+                if position < len(_index_keys) and _index_keys[position] == key:
+                    del _index_keys[position]
+
+
+def _column(rows, column):
+    return rows[column] if rows is not None and column in rows else []
+
+
+def _on_customer_rows(added, removed, replace):
+    _index_customer_names("customers", _column(added, "Name"), _column(removed, "Name"), replace)
+
+
+def _on_sales_rows(added, removed, replace):
+    _index_customer_names("sales", _column(added, "Customer"), _column(removed, "Customer"), replace)
+
+
+cachefx.add_listener("sheet_key", "Customers", _on_customer_rows)
+cachefx.add_listener("sales_sheet_key", "Final Sales", _on_sales_rows)
+
+
+def _index_loaded(source, loader, column, ctx, secret_name, title):
+    # A result adopted from a published snapshot never went through load_tab,
+    # so the listeners did not see its rows: index it from the result itself,
+    # until load_tab has read the tab (its listeners then keep the index)
+    frame = ctx.load(loader) if ctx is not None else loader()
+    if cachefx.is_tab_loaded(secret_name, title):
+        return
+    as_of = frame.attrs.get("as_of")
+    with _index_lock:
+        if as_of is None or as_of == _index_as_of[source]:
+            return
+        _index_as_of[source] = as_of
+
+    # Closed years included, like the rows the listener sees
+    frame = arcfx.load(loader, ctx=ctx)
+    _index_customer_names(source, _column(frame, column), [], True)
+
+
+def get_customer_names(ctx=None):
+    """Sorted, casefold-unique customer names from the directory and past sales."""
+    # Make sure both tabs have been read at least once (cached after that)
+    if ctx is not None:
+        ctx.load(load_customers_data)
+    else:
+        load_customers_data()
+    _index_loaded("sales", sfx.get_sales_df, "Customer", ctx, "sales_sheet_key", "Final Sales")
+
+    with _index_lock:
+        directory, sales = _index_names["customers"], _index_names["sales"]
+        return [directory.get(key) or sales[key] for key in _index_keys]
+
+
+def display_customers_table(ctx=None):
     """Display customers in a formatted table."""
     st.subheader("📋 Customer Directory")
     
-    customers_df = load_customers_data()
+    customers_df = ctx.load(load_customers_data) if ctx is not None else load_customers_data()
     
     if customers_df.empty:
         st.info("No customers found. Add your first customer using the form above!")
@@ -135,12 +219,6 @@ def create_customer_form():
                 st.error("❌ Please fill in all required fields")
             else:
                 try:
-                    # Connect to Google Sheets
-                    sheet_credentials = st.secrets["sheet_credentials"]
-                    gc = gspread.service_account_from_dict(sheet_credentials)
-                    pepper_workbook = gc.open_by_key(st.secrets["sheet_key"])
-                    customers_sheet = pepper_workbook.worksheet("Customers")
-                    
                     # Create new customer data as dictionary matching column names
                     customer_data = {
                         "Name": customer_name.strip(),
@@ -150,22 +228,17 @@ def create_customer_form():
                         "Email": email.strip() if email else ""
                     }
                     
-                    # Get next row index and write using set_with_dataframe
-                    with st.spinner("Saving customer data..."):
-                        all_values = customers_sheet.get_all_values()
-                        next_row_index = len(all_values) + 1
-                        
-                        set_with_dataframe(
-                            customers_sheet,
-                            pd.DataFrame([customer_data]),
-                            row=next_row_index,
-                            include_column_header=False,
-                            include_index=False,
-                        )
+                    # Queue for Google Sheets (written in the background)
+                    submission_id = qfx.enqueue("customers", "sheet_key", "Customers", customer_data.values())
+                    if qfx.wait(submission_id):
+                        # The row may have been sent by another process's worker
+                        cachefx.invalidate("customers")
                         st.success(f"✅ Customer '{customer_name}' added successfully!")
                         st.balloons()
                         # Trigger rerun to refresh the table
                         st.rerun()
+                    else:
+                        st.warning(f"⏳ Customer '{customer_name}' is saved and will show up once it has synced")
                     
                 except Exception as e:
                     st.error(f"❌ Error adding customer: {str(e)}")
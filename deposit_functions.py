@@ -1,22 +1,23 @@
 import calendar
-import datetime
 from typing import List
 
-import gspread
 import pandas as pd
 import streamlit as st
-from gspread_dataframe import get_as_dataframe
+
+import cache_functions as cachefx
+import sql_functions as sqlfx
 
 
 # TODO: Make the load_df function generic
+@cachefx.cached("deposits", snapshot=1, schema={"Date": "datetime64[ns]", "Amount": "float64"})
 def load_deposits():
-    sheet_credentials = st.secrets["sheet_credentials"]
-    gc = gspread.service_account_from_dict(sheet_credentials)
+    return cachefx.load_tab("sheet_key", "Deposits")
+
+
+sqlfx.register_table("deposits", load_deposits, date="Date", amount="Amount")
 
-    pepper_workbook = gc.open_by_key(st.secrets["sheet_key"])
-    deposits_sheet = pepper_workbook.worksheet("Deposits")
-    deposits_df = get_as_dataframe(deposits_sheet, parse_dates=True)
 
+def clean_deposits_df(deposits_df):
     deposits_df.drop(columns=["Timestamp"], inplace=True)
     deposits_df["Date"] = pd.to_datetime(deposits_df["Date"], format="%d/%m/%y")
 
@@ -25,6 +26,9 @@ def load_deposits():
     return result
 
 
+cachefx.register_tab("deposits", "sheet_key", "Deposits", clean_deposits_df, tombstones=True, parse_dates=True)
+
+
 def format_date(input_date):
     # Convert the input string to a datetime object
     # date_object = datetime.strptime(input_date, '%d/%m/%y')
@@ -96,18 +100,12 @@ def filter_data(
         data = data[data["Date"].dt.month.isin(values)]
 
     if filter_name == "start_date":
-        date_string = str(values)
-        formatted_start_date = datetime.datetime.strptime(
-            date_string, "%Y-%m-%d"
-        ).strftime("%d/%m/%Y")
-        data = data[data["Date"] >= formatted_start_date]
+        # Compared as dates, like sqlfx's WHERE clause (not as dd/mm/yyyy text)
+        data = data[data["Date"] >= pd.Timestamp(str(values))]
 
     if filter_name == "end_date":
-        date_string = str(values)
-        formatted_start_date = datetime.datetime.strptime(
-            date_string, "%Y-%m-%d"
-        ).strftime("%d/%m/%Y")
-        data = data[data["Date"] <= formatted_start_date]
+        # The whole end day counts, times included
+        data = data[data["Date"] < pd.Timestamp(str(values)) + pd.Timedelta(days=1)]
 
     return data
     return data
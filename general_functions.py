@@ -2,13 +2,18 @@ import calendar
 import datetime
 from datetime import date
 
+import pandas as pd
 import streamlit as st
 import streamlit_authenticator as stauth
 import yaml
+from pytz import timezone as tz
 from yaml.loader import SafeLoader
 
+import cache_functions as cachefx
 import cost_functions as cfx
-import sales_functions as sfx
+import customers_functions as cusfx
+import sheets_functions as shfx
+import storage_functions as storefx
 
 
 
@@ -49,6 +54,138 @@ def get_month_name_dict():
     return {i: month_name for i, month_name in enumerate(calendar.month_name) if i != 0}
 
 
+def show_data_as_of(*frames):
+    """Caption with the time the oldest of the frames' data was read from Sheets
+    (their ``attrs["as_of"]``, see cachefx.cached)."""
+    times = [frame.attrs["as_of"] for frame in frames if frame.attrs.get("as_of") is not None]
+    if times:
+        as_of = datetime.datetime.fromtimestamp(min(times), tz("Africa/Nairobi"))
+        st.caption(f"🕒 Data as of {as_of:%H:%M}")
+
+
+def _to_cell(value):
+    # numpy scalars are not JSON serialisable, and an emptied cell is sent as ""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ""
+    return value.item() if hasattr(value, "item") else value
+
+
+def get_tombstone_cells(secret_name: str, title: str, index):
+    """Cells that void the given records (index = sheet row - 2) of a tab
+    registered with tombstones, and the tombstone columns this adds to its
+    header, as ``(cells, new_columns)`` for storefx.update_cells and
+    cachefx.tombstone_rows."""
+    positions, new_columns, cells = {}, {}, {}
+    for name in cachefx.TOMBSTONE_COLUMNS:
+        try:
+            positions[name] = cachefx.get_sheet_column(secret_name, title, name)
+        except ValueError:
+            pass
+
+    missing = [name for name in cachefx.TOMBSTONE_COLUMNS if name not in positions]
+    if missing:
+        # First void in this tab (or columns not fetched yet): look at the whole header once
+        values = storefx.read_values(secret_name, title)
+        header = [str(name).strip().casefold() for name in values[0]] if values else []
+        width = max((len(row) for row in values), default=0)
+        for name in missing:
+            if name.casefold() in header:
+                positions[name] = header.index(name.casefold())
+            else:
+                positions[name] = width
+                cells[(1, width)] = name
+                width += 1
+            new_columns[name] = positions[name]
+
+    deleted_at = datetime.datetime.now(tz("Africa/Nairobi")).strftime("%d/%m/%Y %H:%M:%S")
+    status_column, deleted_at_column = (positions[name] for name in cachefx.TOMBSTONE_COLUMNS)
+    for i in index:
+        cells[(i + 2, status_column)] = cachefx.DELETED_STATUS
+        cells[(i + 2, deleted_at_column)] = deleted_at
+
+    return cells, new_columns
+
+
+def show_record_editor(
+    records, secret_name: str, title: str, editable, key: str, voidable: bool = False, totals=None
+):
+    """Edit mode over cleaned records of a registered tab (index = sheet row - 2).
+
+    ``editable`` maps a record column to ``(sheet column, to_cell)``: the sheet
+    column is a header name or a 0-based position, and ``to_cell`` turns an
+    edited value into what is written (None writes it as is). ``totals``
+    maps a read-only record column to ``(sheet column, inputs, compute)``:
+    when any of its ``inputs`` changes, ``compute(record)`` is written to it
+    in the same update. With ``voidable`` records can also be voided (tabs
+    registered with tombstones). Only the changed cells are sent, in one
+    batch update, and the cached rows are patched instead of reloading the
+    dataset.
+    """
+    if not st.toggle("✏️ Edit records", key=f"{key}_toggle"):
+        return
+    if records.empty:
+        st.info("No records to edit")
+        return
+
+    view = records.copy()
+    view.insert(0, "Sheet Row", view.index + 2)
+    if voidable:
+        view["Void"] = False
+    edited = st.data_editor(
+        view,
+        key=key,
+        hide_index=True,
+        use_container_width=True,
+        disabled=[column for column in view.columns if column not in editable and column != "Void"],
+    )
+
+    voided = list(view.index[edited["Void"]]) if voidable else []
+
+    cells, patches = {}, {}
+    for column, (sheet_column, to_cell) in editable.items():
+        if column not in view.columns:
+            continue
+        before, after = view[column], edited[column]
+        changed = ~((before == after) | (before.isna() & after.isna()))
+        for index in view.index[changed]:
+            value = after.loc[index]
+            cell = to_cell(value) if to_cell is not None and not pd.isna(value) else value
+            cells[(index + 2, cachefx.get_sheet_column(secret_name, title, sheet_column))] = _to_cell(cell)
+            patches.setdefault(index, {})[column] = value
+
+    for column, (sheet_column, inputs, compute) in (totals or {}).items():
+        if column not in view.columns:
+            continue
+        for index, patch in patches.items():
+            if not any(name in patch for name in inputs):
+                continue
+            value = compute(edited.loc[index])
+            cells[(index + 2, cachefx.get_sheet_column(secret_name, title, sheet_column))] = _to_cell(value)
+            patch[column] = value
+
+    if not cells and not voided:
+        return
+
+    st.caption(f"{len(cells)} changed cells in {len(patches)} records, {len(voided)} records to void")
+    if st.button("Save changes", key=f"{key}_save", type="primary"):
+        try:
+            tombstone_cells, new_columns = (
+                get_tombstone_cells(secret_name, title, voided) if voided else ({}, {})
+            )
+            storefx.update_cells(secret_name, title, {**cells, **tombstone_cells})
+        except shfx.WriteUncertain:
+            st.error("Google Sheets did not confirm the save. Reload the page to check the records before saving again.")
+            return
+        except shfx.SheetsUnavailable:
+            st.error("Google Sheets is not responding, nothing was saved. Please try again in a minute.")
+            return
+        cachefx.patch_tab(secret_name, title, patches)
+        if voided:
+            cachefx.tombstone_rows(secret_name, title, voided, new_columns)
+        st.success(f"Saved {len(cells)} cells and voided {len(voided)} records")
+        st.rerun()
+
+
 def set_page_config():
     st.set_page_config(page_title="Anjo Farms", page_icon="🫑", layout="wide")
 
@@ -70,7 +207,7 @@ def auth():
     return name, authentication_status, username, authenticator
 
 
-def show_filters(nav_bar_selection: str):
+def show_filters(nav_bar_selection: str, ctx=None):
     years = st.multiselect("Select Years", get_years_since_2022(),
                            placeholder="You can choose multiple options",
                            default=datetime.datetime.now().year if st.session_state.date_range_toggle is False else None,
@@ -90,7 +227,7 @@ def show_filters(nav_bar_selection: str):
                                          placeholder="You can choose multiple options")
 
     if nav_bar_selection == "Sales":
-        unique_customers = sfx.get_customers()
+        unique_customers = cusfx.get_customer_names(ctx)
         customers = st.multiselect("Select Customers", unique_customers,
                                    placeholder="You can choose multiple options")
 
@@ -6,10 +6,16 @@ import altair as alt
 import gspread
 import pandas as pd
 import streamlit as st
-from gspread_dataframe import get_as_dataframe, set_with_dataframe
 from pytz import timezone as tz
 
+import archive_functions as arcfx
+import cache_functions as cachefx
+import general_functions as gfx
+import queue_functions as qfx
 import sales_functions as sfx
+import sheets_functions as shfx
+import snapshot_functions as snapfx
+import sql_functions as sqlfx
 
 
 @st.cache_data
@@ -82,13 +88,11 @@ def clean_harvests_df(repeated_harvests_df, customers_harvest_df):
         ["Date", "Customer", "Structure", "Quantity", "Entered By"]
     ].dropna()
     final_df["Date"] = pd.to_datetime(final_df["Date"], format="%d/%m/%y")
+    for column in ["Customer", "Structure", "Entered By"]:
+        final_df[column] = final_df[column].astype(str)
+    final_df["Quantity"] = final_df["Quantity"].astype(float)
 
-    final_df = final_df.sort_values(by="Date", ascending=False)
-
-    final_df["Date"] = final_df["Date"].apply(format_date)
-    final_df.set_index("Date", inplace=True)
-
-    return final_df
+    return final_df.sort_values(by="Date", ascending=False).reset_index(drop=True)
 
 
 def process_customer(sales_df, customer):
@@ -124,21 +128,17 @@ def filter_data(
         data = data[data["Date"].dt.month.isin(values)]
 
     if filter_name == "customers":
-        data = data[data["Customer"].isin(values)]
+        # Names come from the casefold-deduplicated customer index
+        wanted = [value.casefold() for value in values]
+        data = data[data["Customer"].astype(str).str.casefold().isin(wanted)]
 
     if filter_name == "start_date":
-        date_string = str(values)
-        formatted_start_date = datetime.datetime.strptime(
-            date_string, "%Y-%m-%d"
-        ).strftime("%d/%m/%Y")
-        data = data[data["Date"] >= formatted_start_date]
+        # Compared as dates, like sqlfx's WHERE clause (not as dd/mm/yyyy text)
+        data = data[data["Date"] >= pd.Timestamp(str(values))]
 
     if filter_name == "end_date":
-        date_string = str(values)
-        formatted_start_date = datetime.datetime.strptime(
-            date_string, "%Y-%m-%d"
-        ).strftime("%d/%m/%Y")
-        data = data[data["Date"] <= formatted_start_date]
+        # The whole end day counts, times included
+        data = data[data["Date"] < pd.Timestamp(str(values)) + pd.Timedelta(days=1)]
 
     return data
 
@@ -152,26 +152,67 @@ def convert_date_range(date_tuple):
     return converted_dates
 
 
+# The legacy ODK tabs stopped changing when harvests moved to the Final
+# Harvests form, so their join is built once and kept as a local snapshot.
+# Bump when clean_harvests_df's output changes.
+LEGACY_HARVESTS_SNAPSHOT = "legacy_harvests"
+LEGACY_HARVESTS_VERSION = 1
+
+
+class LegacySnapshotError(RuntimeError):
+    """The legacy harvests could not be published as a snapshot."""
+
+
 def get_harvests_df():
+    """The joined legacy harvests (Date, Customer, Structure, Quantity, Entered By),
+    from the local snapshot; built from the sheet only if there is none."""
+    published = snapfx.read_snapshot(LEGACY_HARVESTS_SNAPSHOT, LEGACY_HARVESTS_VERSION)
+    if published is not None:
+        legacy_df = published[0].to_pandas()
+        legacy_df.attrs["as_of"] = published[1]
+        return legacy_df
+
+    # First load on this host. Nothing cached to invalidate: the caller is loading
+    return _publish_legacy_harvests()
+
+
+def _publish_legacy_harvests():
     repeated_harvests_df, customers_harvests_df = load_harvests_df()
     final_harvests_df = clean_harvests_df(repeated_harvests_df, customers_harvests_df)
 
+    # Raised, not swallowed: without the snapshot every load re-reads the legacy tabs
+    try:
+        published = snapfx.write_snapshot(LEGACY_HARVESTS_SNAPSHOT, LEGACY_HARVESTS_VERSION, final_harvests_df)
+    except OSError as e:
+        raise LegacySnapshotError(f"Could not write the legacy harvests snapshot: {e}") from e
+    if published is None:
+        raise LegacySnapshotError("The legacy harvests cannot be stored as Arrow (mixed column types?)")
+
     return final_harvests_df
 
 
 def load_harvests_df():
-    sheet_credentials = st.secrets["sheet_credentials"]
-    gc = gspread.service_account_from_dict(sheet_credentials)
+    # Read straight from Sheets (one batchGet): the tabs are not mirrored or cached
+    values = shfx.batch_get_values(
+        "harvest_sheet_key", [("data-structures_repeat", 1), ("Sheet1", 1)]
+    )
+    repeated_harvests_df, customer_harvests_df = [
+        shfx.values_to_frame(tab_values, parse_dates=True) for tab_values in values
+    ]
+
+    return repeated_harvests_df, customer_harvests_df
 
-    anjo_harvests_workbook = gc.open_by_url(st.secrets["harvest_sheet_key"])
 
-    repeated_harvests_sheet = anjo_harvests_workbook.worksheet("data-structures_repeat")
-    repeated_harvests_df = get_as_dataframe(repeated_harvests_sheet, parse_dates=True)
+def rebuild_legacy_harvests():
+    """Re-read the legacy ODK tabs and replace their snapshot, e.g. after a
+    correction in the sheet:
 
-    customer_harvests_sheet = anjo_harvests_workbook.worksheet("Sheet1")
-    customer_harvests_df = get_as_dataframe(customer_harvests_sheet, parse_dates=True)
+        python -c "import harvest_functions as hfx; hfx.rebuild_legacy_harvests()"
+    """
+    final_harvests_df = _publish_legacy_harvests()
+    cachefx.invalidate("harvests")
 
-    return repeated_harvests_df, customer_harvests_df
+    return final_harvests_df
 
 
 def get_units():
@@ -197,107 +238,142 @@ def get_greenhouses():
     return ["Structure A", "Structure B", "Structure C", "Structure D", "Structure E", "Structure F"]
 
 
+@cachefx.cached(
+    "harvests", stale_while_revalidate=True,
+    schema={
+        "Date": "datetime64[ns]", **{f"Line_{i}": "float64" for i in range(1, 10)}, "Total": "float64",
+        "Customer": object, "Greenhouse": object,
+    },
+)
 def load_new_harvests_data():
     """Load harvest data from 'Final Harvests' worksheet with line details."""
     try:
-        sheet_credentials = st.secrets["sheet_credentials"]
-        gc = gspread.service_account_from_dict(sheet_credentials)
-        anjo_harvests_workbook = gc.open_by_url(st.secrets["harvest_sheet_key"])
-        
-        # Try to get the worksheet, return empty if doesn't exist
-        try:
-            final_harvests_sheet = anjo_harvests_workbook.worksheet("Final Harvests")
-        except gspread.exceptions.WorksheetNotFound:
-            return pd.DataFrame()
-        
-        harvests_df = get_as_dataframe(final_harvests_sheet, parse_dates=True)
-        
-        # Rename columns based on actual sheet structure
-        # Structure: Timestamp | Date of harvest | Quantity harvested in kgs (Line1) | 
-        #            Unnamed:3-10 (Lines 2-9) | Unnamed:11 (Total) | Customer/Destination | Greenhouse
-        column_renames = {}
-        
-        # Rename "Quantity harvested in kgs" to Line_1
-        if 'Quantity harvested in kgs' in harvests_df.columns:
-            column_renames['Quantity harvested in kgs'] = 'Line_1'
-        
-        # Lines 2-9 are in Unnamed: 3 through Unnamed: 10
-        for i in range(3, 11):
-            col_name = f'Unnamed: {i}'
-            if col_name in harvests_df.columns:
-                column_renames[col_name] = f'Line_{i-1}'  # Line_2 through Line_9
-        
-        # Total is in Unnamed: 11
-        if 'Unnamed: 11' in harvests_df.columns:
-            column_renames['Unnamed: 11'] = 'Total'
-        
-        # Standard column renames
-        if 'Date of harvest' in harvests_df.columns:
-            column_renames['Date of harvest'] = 'Date'
-        if 'Customer/Destination' in harvests_df.columns:
-            column_renames['Customer/Destination'] = 'Customer'
-        
-        harvests_df.rename(columns=column_renames, inplace=True)
-        
-        # Keep only the columns we need
-        required_cols = ['Timestamp', 'Date', 'Line_1', 'Line_2', 'Line_3', 'Line_4', 
-                        'Line_5', 'Line_6', 'Line_7', 'Line_8', 'Line_9', 'Total', 
-                        'Customer', 'Greenhouse']
-        available_cols = [col for col in required_cols if col in harvests_df.columns]
-        harvests_df = harvests_df[available_cols]
-        
-        # Check if Date column exists (after renaming)
-        if "Date" not in harvests_df.columns:
-            return pd.DataFrame()
-        
-        # Drop rows where Date is missing
-        harvests_df = harvests_df.dropna(subset=["Date"]).copy()
-        
-        # If no data, return empty DataFrame
-        if harvests_df.empty:
-            return pd.DataFrame()
-        
-        # Parse date with flexible format handling
-        # pd.to_datetime with dayfirst=True will handle both dd/mm/yyyy and dd/mm/yy
-        harvests_df["Date"] = pd.to_datetime(harvests_df["Date"], dayfirst=True, errors='coerce')
-        
-        # Ensure line columns exist and are numeric
-        for i in range(1, 10):
-            col = f"Line_{i}"
-            if col not in harvests_df.columns:
-                harvests_df[col] = 0
-            harvests_df[col] = pd.to_numeric(harvests_df[col], errors="coerce").fillna(0)
-        
-        # Handle Total column - clean text like "40 KGS", "62KGS" before parsing
-        if "Total" in harvests_df.columns:
-            # Remove "KGS", "KG", spaces, and convert to numeric
-            harvests_df["Total"] = harvests_df["Total"].astype(str).str.replace(r'\s*KG[S]?\s*', '', case=False, regex=True)
-            harvests_df["Total"] = pd.to_numeric(harvests_df["Total"], errors="coerce").fillna(0)
-        else:
-            # Calculate total from lines if not present
-            harvests_df["Total"] = sum(harvests_df[f"Line_{i}"] for i in range(1, 10))
-        
-        return harvests_df
-        
+        return cachefx.load_tab("harvest_sheet_key", "Final Harvests")
+    except gspread.exceptions.WorksheetNotFound:
+        # Return empty if the worksheet doesn't exist yet
+        return pd.DataFrame()
+    except shfx.SheetsUnavailable:
+        # Not "no harvests": let the page say Sheets is unavailable
+        raise
     except Exception:
         return pd.DataFrame()
 
 
+# Record column -> (sheet column, to_cell) for gfx.show_record_editor. Lines 2-9
+# and Total have no header, so they are addressed by position.
+EDITABLE_COLUMNS = {
+    "Date": ("Date of harvest", lambda date: date.strftime("%d/%m/%Y")),
+    "Line_1": ("Quantity harvested in kgs", None),
+    **{f"Line_{i}": (i + 1, None) for i in range(2, 10)},
+    "Customer": ("Customer/Destination", None),
+    "Greenhouse": ("Greenhouse", None),
+}
+
+# Record column -> (sheet column, inputs, compute) for gfx.show_record_editor
+LINE_COLUMNS = [f"Line_{i}" for i in range(1, 10)]
+TOTAL_COLUMNS = {
+    "Total": (11, LINE_COLUMNS, lambda record: pd.to_numeric(record[LINE_COLUMNS], errors="coerce").sum()),
+}
+
+sqlfx.register_table(
+    "harvest_lines", load_new_harvests_data,
+    date="Date", customer="Customer", structure="Greenhouse",
+    **{f"line_{i}": f"Line_{i}" for i in range(1, 10)},
+)
+
+
+def clean_new_harvests_df(harvests_df):
+    """Clean raw 'Final Harvests' rows into Date, Line_1..Line_9, Total, Customer, Greenhouse."""
+    # Rename columns based on actual sheet structure
+    # Structure: Timestamp | Date of harvest | Quantity harvested in kgs (Line1) | 
+    #            Unnamed:3-10 (Lines 2-9) | Unnamed:11 (Total) | Customer/Destination | Greenhouse
+    column_renames = {}
+    
+    # Rename "Quantity harvested in kgs" to Line_1
+    if 'Quantity harvested in kgs' in harvests_df.columns:
+        column_renames['Quantity harvested in kgs'] = 'Line_1'
+    
+    # Lines 2-9 are in Unnamed: 3 through Unnamed: 10
+    for i in range(3, 11):
+        col_name = f'Unnamed: {i}'
+        if col_name in harvests_df.columns:
+            column_renames[col_name] = f'Line_{i-1}'  # Line_2 through Line_9
+    
+    # Total is in Unnamed: 11
+    if 'Unnamed: 11' in harvests_df.columns:
+        column_renames['Unnamed: 11'] = 'Total'
+    
+    # Standard column renames
+    if 'Date of harvest' in harvests_df.columns:
+        column_renames['Date of harvest'] = 'Date'
+    if 'Customer/Destination' in harvests_df.columns:
+        column_renames['Customer/Destination'] = 'Customer'
+    
+    harvests_df.rename(columns=column_renames, inplace=True)
+    
+    # Keep only the columns we need
+    required_cols = ['Timestamp', 'Date', 'Line_1', 'Line_2', 'Line_3', 'Line_4', 
+                    'Line_5', 'Line_6', 'Line_7', 'Line_8', 'Line_9', 'Total', 
+                    'Customer', 'Greenhouse']
+    available_cols = [col for col in required_cols if col in harvests_df.columns]
+    harvests_df = harvests_df[available_cols]
+    
+    # Check if Date column exists (after renaming)
+    if "Date" not in harvests_df.columns:
+        return pd.DataFrame()
+    
+    # Drop rows where Date is missing
+    harvests_df = harvests_df.dropna(subset=["Date"]).copy()
+    
+    # If no data, return empty DataFrame
+    if harvests_df.empty:
+        return pd.DataFrame()
+    
+    # Parse date with flexible format handling
+    # pd.to_datetime with dayfirst=True will handle both dd/mm/yyyy and dd/mm/yy
+    harvests_df["Date"] = pd.to_datetime(harvests_df["Date"], dayfirst=True, errors='coerce')
+    
+    # Ensure line columns exist and are numeric
+    for i in range(1, 10):
+        col = f"Line_{i}"
+        if col not in harvests_df.columns:
+            harvests_df[col] = 0
+        harvests_df[col] = pd.to_numeric(harvests_df[col], errors="coerce").fillna(0)
+    
+    # Handle Total column - clean text like "40 KGS", "62KGS" before parsing
+    if "Total" in harvests_df.columns:
+        # Remove "KGS", "KG", spaces, and convert to numeric
+        harvests_df["Total"] = harvests_df["Total"].astype(str).str.replace(r'\s*KG[S]?\s*', '', case=False, regex=True)
+        harvests_df["Total"] = pd.to_numeric(harvests_df["Total"], errors="coerce").fillna(0)
+    else:
+        # Calculate total from lines if not present
+        harvests_df["Total"] = sum(harvests_df[f"Line_{i}"] for i in range(1, 10))
+    
+    return harvests_df
+
+
+cachefx.register_tab(
+    "harvests", "harvest_sheet_key", "Final Harvests", clean_new_harvests_df, parse_dates=True
+)
+
+
+@cachefx.cached(
+    "harvests", snapshot=1, stale_while_revalidate=True,
+    schema={"Date": "datetime64[ns]", "Customer": object, "Structure": object, "Quantity": "float64", "Entered By": object},
+)
 def load_all_harvests_data():
     """Load and combine harvest data from old and new worksheets."""
     combined_data = []
+    legacy_as_of = None
     
     # Load old data (silently fail if issues)
     try:
         old_df = get_harvests_df()
+        legacy_as_of = old_df.attrs.pop("as_of", None)
         if not old_df.empty:
-            # Reset index to get Date as column
-            old_df = old_df.reset_index()
-            # Parse date
-            old_df["Date"] = pd.to_datetime(old_df["Date"], format="%d/%b/%Y")
-            # Rename Structure to match, Quantity is already named correctly
-            old_df = old_df[["Date", "Customer", "Structure", "Quantity", "Entered By"]].copy()
             combined_data.append(old_df)
+    except (shfx.SheetsUnavailable, LegacySnapshotError):
+        raise
     except Exception:
         pass
     
@@ -321,6 +397,8 @@ def load_all_harvests_data():
             new_df_simplified = new_df_simplified[available_cols].copy()
             
             combined_data.append(new_df_simplified)
+    except shfx.SheetsUnavailable:
+        raise
     except Exception:
         pass
     
@@ -328,11 +406,24 @@ def load_all_harvests_data():
     if combined_data:
         final_df = pd.concat(combined_data, ignore_index=True)
         final_df = final_df.sort_values(by="Date", ascending=False)
-        return final_df
+        # Closed years are only hashed again once the legacy snapshot or the tab changed
+        source = (legacy_as_of, cachefx.get_tab_version("harvest_sheet_key", "Final Harvests"))
+        return arcfx.freeze_closed_years("harvests", final_df, source)
     else:
         return pd.DataFrame()
 
 
+def _sort_by_newest(harvests_df):
+    return harvests_df.sort_values(by="Date", ascending=False)
+
+
+arcfx.register("harvests", load_all_harvests_data, finish=_sort_by_newest)
+sqlfx.register_table(
+    "harvests", load_all_harvests_data,
+    date="Date", customer="Customer", structure="Structure", quantity="Quantity",
+)
+
+
 def create_harvest_form(current_user, customers_list):
     """Display form to create a new harvest entry."""
     st.subheader("➕ Add New Harvest")
@@ -424,12 +515,6 @@ def create_harvest_form(current_user, customers_list):
                 st.error("❌ Total volume must be greater than 0")
             else:
                 try:
-                    # Connect to Google Sheets
-                    sheet_credentials = st.secrets["sheet_credentials"]
-                    gc = gspread.service_account_from_dict(sheet_credentials)
-                    anjo_harvests_workbook = gc.open_by_url(st.secrets["harvest_sheet_key"])
-                    final_harvests_sheet = anjo_harvests_workbook.worksheet("Final Harvests")
-                    
                     # Create timestamp
                     tz_eat = tz("Africa/Nairobi")
                     timestamp = datetime.datetime.now(tz_eat).strftime("%d-%b-%Y %H:%M:%S EAT")
@@ -441,8 +526,8 @@ def create_harvest_form(current_user, customers_list):
                     # Timestamp | Date of harvest | Quantity harvested in kgs (Line1) | 
                     # Unnamed:3-10 (Lines 2-9) | Unnamed:11 (Total) | Customer/Destination | Greenhouse
                     
-                    # Create DataFrame with columns in correct order
-                    harvest_data = pd.DataFrame([{
+                    # Create row with columns in correct order
+                    harvest_data = {
                         "Timestamp": timestamp,
                         "Date of harvest": formatted_date,
                         "Quantity harvested in kgs": line_values[0] if line_values else 0,  # Line_1
@@ -457,25 +542,25 @@ def create_harvest_form(current_user, customers_list):
                         "Total": total,  # Write as number for easier parsing
                         "Customer/Destination": customer,
                         "Greenhouse": greenhouse,
-                    }])
+                    }
                     
-                    # Write to Google Sheets (data starts at row 3)
-                    with st.spinner("Saving harvest data..."):
-                        all_values = final_harvests_sheet.get_all_values()
-                        # Since data starts at row 3, next_row_index should be len(all_values) + 1
-                        # But if sheet is empty or only has headers, we want to write at row 3
-                        next_row_index = max(3, len(all_values) + 1)
-                        
-                        set_with_dataframe(
-                            final_harvests_sheet,
-                            harvest_data,
-                            row=next_row_index,
-                            include_column_header=False,
-                            include_index=False,
-                        )
+                    # Queue for Google Sheets (data starts at row 3, so if the
+                    # sheet is empty or only has headers the row goes to row 3)
+                    submission_id = qfx.enqueue(
+                        "harvests",
+                        "harvest_sheet_key",
+                        "Final Harvests",
+                        harvest_data.values(),
+                        first_data_row=3,
+                    )
+                    if qfx.wait(submission_id):
+                        # The row may have been sent by another process's worker
+                        cachefx.invalidate("harvests")
                         st.success("✅ Harvest saved successfully!")
                         st.balloons()
                         st.rerun()
+                    else:
+                        st.warning("⏳ Harvest saved; it will show up once it has synced")
                     
                 except Exception as e:
                     st.error(f"❌ Error saving harvest: {str(e)}")
@@ -520,52 +605,16 @@ def display_harvests_list(harvests_df, detailed_df=None):
     )
 
 
-def analyze_line_performance(detailed_df):
-    """Analyze performance of individual lines from detailed harvest data, grouped by structure."""
-    if detailed_df.empty:
-        return pd.DataFrame()
-    
-    # Check if Greenhouse column exists
-    if "Greenhouse" not in detailed_df.columns:
-        return pd.DataFrame()
-    
-    line_data = []
-    
-    # Get unique structures/greenhouses
-    structures = detailed_df["Greenhouse"].unique()
-    
-    for structure in structures:
-        structure_df = detailed_df[detailed_df["Greenhouse"] == structure]
-        
-        for i in range(1, 10):
-            col = f"Line_{i}"
-            if col in structure_df.columns:
-                line_values = pd.to_numeric(structure_df[col], errors="coerce").fillna(0)
-                non_zero_values = line_values[line_values > 0]
-                if len(non_zero_values) > 0:
-                    line_data.append({
-                        "Structure": structure,
-                        "Line": f"Line {i}",
-                        "Avg_Volume": non_zero_values.mean(),
-                        "Harvest_Count": len(non_zero_values),
-                        "Total_Volume": non_zero_values.sum()
-                    })
-    
-    if line_data:
-        return pd.DataFrame(line_data).sort_values(["Structure", "Avg_Volume"], ascending=[True, False])
-    else:
-        return pd.DataFrame()
-
-
-def display_harvests_overview(harvests_df, detailed_df):
+def display_harvests_overview(harvests_df, detailed_df, ctx=None, filters=None):
     """Display harvest overview with KPIs and charts."""
+    gfx.show_data_as_of(harvests_df, detailed_df)
     if harvests_df.empty:
         st.info("No harvest data available for the selected filters")
         return
     
     # Load sales data for comparison
     try:
-        sales_df = sfx.get_sales_df()
+        sales_df = arcfx.load(sfx.get_sales_df, (filters or {}).get("years"), ctx)
         
         # Filter sales data to match the same date range as harvest data
         if not sales_df.empty and "Date" in sales_df.columns:
@@ -653,9 +702,7 @@ def display_harvests_overview(harvests_df, detailed_df):
     with col_right:
         # Top Structures
         st.subheader("🏆 Top Greenhouses")
-        structure_performance = harvests_df.groupby("Structure")["Quantity"].sum().reset_index()
-        structure_performance.columns = ["Greenhouse", "Total Volume"]
-        structure_performance = structure_performance.sort_values("Total Volume", ascending=False).head(6)
+        structure_performance = sqlfx.harvest_by_structure(filters, ctx).head(6)
         
         chart = alt.Chart(structure_performance).mark_bar().encode(
             x=alt.X("Total Volume:Q", title="Total Volume (kg)"),
@@ -672,7 +719,7 @@ def display_harvests_overview(harvests_df, detailed_df):
     if not detailed_df.empty:
         st.subheader("📊 Line Performance Analysis by Structure")
         st.info("💡 **Why Track Each Line?** Each line can have different conditions (microclimate) - like temperature, sunlight, or water flow. For example, Line 1 near the door might get more airflow while Line 9 is warmer. By tracking yields per line, you can spot which areas produce best and focus your planting and care on the strongest zones. You can also make changes to improve weaker lines - like adjusting ventilation or shade - to match the performance of your top line.")
-        line_perf = analyze_line_performance(detailed_df)
+        line_perf = sqlfx.harvest_by_line(filters, ctx)
         
         if not line_perf.empty:
             # Group by structure and display in expanders
@@ -1,20 +1,24 @@
 import datetime
 
 import altair as alt
-import gspread
 import pandas as pd
 import streamlit as st
-from gspread_dataframe import set_with_dataframe
 from millify import millify
 from pytz import timezone as tz
 from streamlit_option_menu import option_menu
 
+import archive_functions as arcfx
+import context_functions as ctxfx
 import cost_functions as cfx
 import customers_functions as cusfx
 import deposit_functions as dfx
 import general_functions as gfx
 import harvest_functions as hfx
+import mirror_functions as mfx
+import queue_functions as qfx
 import sales_functions as sfx
+import sheets_functions as shfx
+import sql_functions as sqlfx
 import withdraw_functions as wfx
 
 # ---- Page & Auth ----
@@ -57,11 +61,31 @@ if authentication_status:
         st.session_state["total-price"] = total
         return total
 
-    # Secrets / Sheets client
-    sheet_credentials = st.secrets["sheet_credentials"]
-    gc = gspread.service_account_from_dict(sheet_credentials)
     current_user = st.session_state["name"]
 
+    # Keep the local sheet mirror fresh and the submission queue flushing
+    # in the background (no-ops after the first run)
+    mfx.start()
+    qfx.start()
+
+    # Every dataset this rerun needs is loaded at most once, through this context
+    ctx = ctxfx.DatasetContext()
+
+    # Datasets each page reads (pages this user cannot open load nothing)
+    page_loaders = {
+        "Costs": [cfx.get_expenses_df],
+        "Sales": [sfx.get_sales_df, cusfx.load_customers_data],
+        "Harvests": [
+            hfx.load_all_harvests_data,
+            hfx.load_new_harvests_data,
+            cusfx.load_customers_data,
+            sfx.get_sales_df,
+        ],
+        "Customers": [sfx.get_sales_df, cusfx.load_customers_data],
+        "Deposits": [dfx.load_deposits],
+        "Withdraws": [wfx.load_withdraws] if current_user != "Victor Tindimwebwa" else [],
+    }
+
     # ---- Sidebar ----
 
     with st.sidebar:
@@ -97,12 +121,33 @@ if authentication_status:
         st.session_state["nav_bar_selection"] = nav_bar
         st.session_state["nav_bar"] = nav_bar
 
+        # Start every independent fetch this page needs at once, so the page
+        # waits for the slowest workbook instead of the sum of all of them
+        ctx.prefetch(*page_loaders[nav_bar])
+
+        # Then warm every other page this user can open, without waiting for it
+        if not st.session_state.get("cache_warmed_up"):
+            ctxfx.warm_up(
+                *[loader for page, loaders in page_loaders.items() if page != nav_bar for loader in loaders]
+            )
+            st.session_state["cache_warmed_up"] = True
+
         with st.expander("Filters", expanded=True):
             years, months, cost_categories, customers, start_date, end_date = (
-                gfx.show_filters(nav_bar_selection=st.session_state["nav_bar"])
+                gfx.show_filters(nav_bar_selection=st.session_state["nav_bar"], ctx=ctx)
             )
             months = [k for k, v in gfx.get_month_name_dict().items() if v in months]
 
+            # Same filters as SQL WHERE clauses for the dashboard aggregations
+            filters = {
+                "years": years,
+                "months": months,
+                "cost_categories": cost_categories,
+                "customers": customers,
+                "start_date": start_date,
+                "end_date": end_date,
+            }
+
             if end_date and not start_date:
                 st.error("Cannot have an end date without a start date")
                 st.stop()
@@ -110,6 +155,19 @@ if authentication_status:
                 st.error("Selected start date should be less than the end date")
                 st.stop()
 
+        mirror_age = mfx.get_age(nav_bar.lower())
+        if mirror_age is not None:
+            st.caption(f"🔄 Data synced {int(mirror_age // 60)} min ago")
+
+        pending_submissions, failed_submissions = qfx.get_depths()
+        if pending_submissions:
+            st.caption(f"⏳ {pending_submissions} entries waiting to sync")
+        if failed_submissions:
+            st.error(f"❌ {failed_submissions} entries failed to sync")
+            if st.button("Retry failed entries"):
+                qfx.retry_failed()
+                st.rerun()
+
         st.divider()
 
     # ===================== COSTS =====================
@@ -118,9 +176,7 @@ if authentication_status:
             ["📝 Details", "💰 Dashboard", "📜 Form"]
         )
 
-        anjo_workbook = gc.open_by_key(st.secrets["cost_sheet_key"])
-        expenses_sheet = anjo_workbook.worksheet("Costs")
-        expenses_df = cfx.load_expense_data(expenses_sheet)
+        expenses_df = arcfx.load(cfx.get_expenses_df, years, ctx)
 
         expenses_df = cfx.filter_data(expenses_df, "years", years)
         expenses_df = cfx.filter_data(expenses_df, "months", months)
@@ -132,6 +188,13 @@ if authentication_status:
             with details:
                 if expenses_df.empty:
                     st.info("No records match the filtration criteria")
+                # Edited from the loader's own frame, whose index is still the sheet row
+                editable_df = arcfx.live_rows(cfx.get_expenses_df, ctx)
+                for filter_name in ("years", "months", "cost_categories", "start_date", "end_date"):
+                    editable_df = cfx.filter_data(editable_df, filter_name, filters[filter_name])
+                gfx.show_record_editor(
+                    editable_df, "cost_sheet_key", "Costs", cfx.EDITABLE_COLUMNS, key="costs_editor", voidable=True,
+                )
                 st.subheader("Costs by Categories")
                 df_cost_categories = expenses_df["Cost Category"].dropna().unique()
                 df_cost_categories.sort()
@@ -141,16 +204,17 @@ if authentication_status:
 
         if current_user != "Victor Tindimwebwa":
             with dashboard:
+                gfx.show_data_as_of(expenses_df)
                 if expenses_df.empty:
                     st.info("No cost data available for the selected filters")
                 else:
-                    # Prepare data for visualizations
-                    visuals_df = pd.DataFrame(
-                        {
-                            "Category": expenses_df["Cost Category"],
-                            "Cost": expenses_df["Total Cost"],
-                            "Date": expenses_df["Date"],
-                        }
+                    # Aggregated in SQL with the same filters as the records above
+                    summary = sqlfx.cost_summary(filters, ctx)
+                    category_costs = sqlfx.costs_by_category(filters, ctx)
+                    monthly_costs_df = (
+                        sqlfx.monthly_costs_by_category(filters, ctx)
+                        .groupby("Month", as_index=False)["Cost"]
+                        .sum()
                     )
 
                     # Add custom CSS to reduce metric font sizes
@@ -168,19 +232,19 @@ if authentication_status:
                     # Primary KPIs - Row 1
                     col1, col2, col3, col4 = st.columns(4)
                     with col1:
-                        total_costs = float(visuals_df["Cost"].sum()) if not visuals_df.empty else 0.0
+                        total_costs = float(summary["Cost"])
                         st.metric("💸 Total Costs", f"{total_costs:,.0f} UGX")
 
                     with col2:
-                        total_transactions = len(visuals_df)
+                        total_transactions = int(summary["Transactions"])
                         st.metric("🧾 Total Transactions", f"{total_transactions:,}")
 
                     with col3:
-                        unique_categories = visuals_df["Category"].nunique()
+                        unique_categories = int(summary["Categories"])
                         st.metric("📂 Active Categories", f"{unique_categories}")
 
                     with col4:
-                        number_of_months = visuals_df["Date"].dt.month.nunique() if not visuals_df.empty else 0
+                        number_of_months = int(summary["Months"])
                         st.metric("📅 Months Covered", f"{number_of_months}")
 
                     # Secondary KPIs - Row 2
@@ -194,13 +258,16 @@ if authentication_status:
                         st.metric("💳 Avg per Transaction", f"{avg_cost_per_transaction:,.0f} UGX")
 
                     with col7:
-                        number_of_weeks = (visuals_df["Date"].max() - visuals_df["Date"].min()).days // 7 if not visuals_df.empty else 0
+                        number_of_weeks = (
+                            (pd.Timestamp(summary["Last"]) - pd.Timestamp(summary["First"])).days // 7
+                            if total_transactions else 0
+                        )
                         avg_weekly_cost = total_costs / number_of_weeks if number_of_weeks > 0 else 0
                         st.metric("📈 Avg Weekly Cost", f"{avg_weekly_cost:,.0f} UGX")
 
                     with col8:
                         # Top category by cost
-                        top_category = visuals_df.groupby("Category")["Cost"].sum().idxmax() if not visuals_df.empty else "N/A"
+                        top_category = category_costs["Category"].iloc[0] if not category_costs.empty else "N/A"
                         st.metric("🏆 Top Category", top_category)
 
                     # Performance Insights Section
@@ -211,9 +278,9 @@ if authentication_status:
 
                     with insight_col1:
                         # Highest cost month
-                        monthly_costs = visuals_df.groupby(
-                            visuals_df["Date"].dt.strftime("%B %Y")
-                        )["Cost"].sum()
+                        monthly_costs = monthly_costs_df.set_index(
+                            pd.to_datetime(monthly_costs_df["Month"]).dt.strftime("%B %Y")
+                        )["Cost"]
                         highest_month = monthly_costs.idxmax() if not monthly_costs.empty else "N/A"
                         highest_month_value = monthly_costs.max() if not monthly_costs.empty else 0
 
@@ -253,15 +320,8 @@ if authentication_status:
 
                     with row1_col1:
                         st.markdown("**📅 Costs by Month**")
-                        monthly_costs_df = (
-                            visuals_df.groupby(visuals_df["Date"].dt.to_period("M"))["Cost"]
-                            .sum()
-                            .reset_index()
-                        )
-                        monthly_costs_df["Date"] = monthly_costs_df["Date"].astype(str)
-
                         area_chart = (
-                            alt.Chart(monthly_costs_df)
+                            alt.Chart(monthly_costs_df.rename(columns={"Month": "Date"}))
                             .mark_area(
                                 interpolate="monotone",
                                 opacity=0.3,
@@ -291,12 +351,7 @@ if authentication_status:
 
                     with row1_col2:
                         st.markdown("**📊 Daily Cost Trend (Last 30 Days)**")
-                        daily_costs = (
-                            visuals_df.groupby(visuals_df["Date"].dt.date)["Cost"]
-                            .sum()
-                            .reset_index()
-                        )
-                        daily_costs = daily_costs.tail(30)  # Last 30 days
+                        daily_costs = sqlfx.daily_costs(filters, ctx).tail(30)  # Last 30 days
 
                         daily_chart = (
                             alt.Chart(daily_costs)
@@ -331,12 +386,7 @@ if authentication_status:
 
                     with row2_col1:
                         st.markdown("**🏆 Top Categories by Cost**")
-                        top_categories = (
-                            visuals_df.groupby("Category")["Cost"]
-                            .sum()
-                            .nlargest(10)
-                            .reset_index()
-                        )
+                        top_categories = category_costs.head(10)
 
                         category_chart = (
                             alt.Chart(top_categories)
@@ -370,21 +420,14 @@ if authentication_status:
                     with row2_col2:
                         st.markdown("**📋 Category Performance Summary**")
                         # Create a summary table of category metrics
-                        category_metrics = (
-                            visuals_df.groupby("Category")
-                            .agg({"Cost": ["sum", "count", "mean"]})
-                            .round(0)
-                        )
-
-                        # Flatten column names
-                        category_metrics.columns = [
-                            "Total Cost",
-                            "Transactions",
-                            "Avg per Transaction",
-                        ]
-                        category_metrics = category_metrics.sort_values(
-                            "Total Cost", ascending=False
-                        ).head(10)
+                        category_metrics = pd.DataFrame(
+                            {
+                                "Total Cost": category_costs["Cost"].values,
+                                "Transactions": category_costs["Transactions"].values,
+                                "Avg per Transaction": (category_costs["Cost"] / category_costs["Transactions"]).values,
+                            },
+                            index=pd.Index(category_costs["Category"], name="Category"),
+                        ).round(0).head(10)
 
                         # Format for display
                         category_metrics["Total Cost"] = category_metrics["Total Cost"].apply(
@@ -404,7 +447,7 @@ if authentication_status:
                     
                     with pie_col1:
                         pie = (
-                            alt.Chart(visuals_df)
+                            alt.Chart(category_costs)
                             .mark_arc(innerRadius=80)
                             .encode(
                                 theta=alt.Theta("sum(Cost):Q", title="Cost"),
@@ -424,7 +467,7 @@ if authentication_status:
                     with pie_col2:
                         # Cost breakdown percentages
                         st.markdown("**📊 Top 5 by %**")
-                        category_totals = visuals_df.groupby("Category")["Cost"].sum().sort_values(ascending=False)
+                        category_totals = category_costs.set_index("Category")["Cost"]
                         top_5_pct = category_totals.head(5)
                         total_cost_sum = category_totals.sum()
                         
@@ -518,26 +561,18 @@ if authentication_status:
                             current_user,
                         ]
 
-                        with st.spinner("Saving cost data..."):
-                            pepper_workbook = gc.open_by_key(st.secrets["cost_sheet_key"])
-                            costs_sheet = pepper_workbook.worksheet("Costs")
-                            next_row_index = len(costs_sheet.get_all_values()) + 1
-                            costs_sheet.append_rows(
-                                [data],
-                                value_input_option="user_entered",
-                                insert_data_option="insert_rows",
-                                table_range=f"a{next_row_index}",
-                            )
-                            st.success("✅ Cost saved Successfully")
+                        # Queued locally; the background worker appends it to the sheet
+                        qfx.enqueue("costs", "cost_sheet_key", "Costs", data)
+                        st.success("✅ Cost saved Successfully (syncing to Google Sheets)")
 
     # ===================== SALES =====================
     elif nav_bar == "Sales":
-        customers_list = cusfx.load_customers()
+        customers_list = cusfx.get_customer_names(ctx)
         sales_details, sales_dashboard, sales_form = st.tabs(
             ["📝 Details", "💰 Dashboard", "📜 Form"]
         )
 
-        final_sales_df = sfx.get_sales_df()
+        final_sales_df = arcfx.load(sfx.get_sales_df, years, ctx)
         final_sales_df = sfx.filter_data(final_sales_df, "years", years)
         final_sales_df = sfx.filter_data(final_sales_df, "months", months)
         final_sales_df = sfx.filter_data(final_sales_df, "customers", customers)
@@ -549,6 +584,15 @@ if authentication_status:
                 if final_sales_df.empty:
                     st.info("No records match the filtration criteria")
                 else:
+                    # Edited from the loader's own frame, whose index is still the sheet row
+                    editable_df = arcfx.live_rows(sfx.get_sales_df, ctx)
+                    for filter_name in ("years", "months", "customers", "start_date", "end_date"):
+                        editable_df = sfx.filter_data(editable_df, filter_name, filters[filter_name])
+                    gfx.show_record_editor(
+                        editable_df, "sales_sheet_key", "Final Sales", sfx.EDITABLE_COLUMNS, key="sales_editor",
+                        voidable=True, totals=sfx.TOTAL_COLUMNS,
+                    )
+
                     # Create a comprehensive sales overview
                     st.subheader("📊 Sales Overview")
 
@@ -649,6 +693,7 @@ if authentication_status:
 
         if current_user != "Victor Tindimwebwa":
             with sales_dashboard:
+                gfx.show_data_as_of(final_sales_df)
                 if final_sales_df.empty:
                     st.info("No sales data available for the selected filters")
                 else:
@@ -878,12 +923,9 @@ if authentication_status:
 
                     with row2_col1:
                         st.markdown("**🏆 Top 10 Customers by Revenue**")
-                        top_customers = (
-                            visuals_df.groupby("Customer")["Revenue"]
-                            .sum()
-                            .nlargest(10)
-                            .reset_index()
-                        )
+                        top_customers = sqlfx.revenue_by_customer(filters, ctx)[
+                            ["Customer", "Revenue"]
+                        ].head(10)
 
                         customer_chart = (
                             alt.Chart(top_customers)
@@ -1039,18 +1081,9 @@ if authentication_status:
                             "entered by": current_user,
                         }
 
-                        # Write to Google Sheets
-                        pepper_workbook = gc.open_by_url(st.secrets["sales_sheet_key"])
-                        sales_sheet = pepper_workbook.worksheet("Final Sales")
-                        next_row_index = len(sales_sheet.get_all_values()) + 1
-                        set_with_dataframe(
-                            sales_sheet,
-                            pd.DataFrame([sale_data]),
-                            row=next_row_index,
-                            include_column_header=False,
-                            include_index=False,
-                        )
-                        st.success("✅ Sale saved Successfully")
+                        # Queue for Google Sheets (written in the background)
+                        qfx.enqueue("sales", "sales_sheet_key", "Final Sales", sale_data.values())
+                        st.success("✅ Sale saved Successfully (syncing to Google Sheets)")
 
     # ===================== CUSTOMERS =====================
     elif nav_bar == "Customers":
@@ -1061,13 +1094,14 @@ if authentication_status:
         
         with tab1:
             # Get sales data for customer analysis
-            final_sales_df = sfx.get_sales_df()
+            final_sales_df = arcfx.load(sfx.get_sales_df, years, ctx)
             final_sales_df = sfx.filter_data(final_sales_df, "years", years)
             final_sales_df = sfx.filter_data(final_sales_df, "months", months)
             final_sales_df = sfx.filter_data(final_sales_df, "customers", customers)
             final_sales_df = sfx.filter_data(final_sales_df, "start_date", start_date)
             final_sales_df = sfx.filter_data(final_sales_df, "end_date", end_date)
 
+            gfx.show_data_as_of(final_sales_df)
             if final_sales_df.empty:
                 st.info("No customer data available for the selected filters")
             else:
@@ -1208,7 +1242,7 @@ if authentication_status:
         
         with tab2:
             # Display customers table
-            cusfx.display_customers_table()
+            cusfx.display_customers_table(ctx)
         
         with tab3:
             # Customer creation form
@@ -1218,7 +1252,7 @@ if authentication_status:
     elif nav_bar == "Deposits":
         deposits, deposit_form = st.tabs(["➕ Deposits", "📜 Form"])
 
-        deposits_df = dfx.load_deposits()
+        deposits_df = ctx.load(dfx.load_deposits)
         deposits_df = dfx.filter_data(deposits_df, "years", years)
         deposits_df = dfx.filter_data(deposits_df, "months", months)
         deposits_df = dfx.filter_data(deposits_df, "start_date", start_date)
@@ -1228,6 +1262,21 @@ if authentication_status:
             with deposits:
                 if deposits_df.empty:
                     st.info("No records match the filtration criteria")
+                gfx.show_record_editor(deposits_df, "sheet_key", "Deposits", {}, key="deposits_editor", voidable=True)
+                if not deposits_df.empty:
+                    st.markdown("**📅 Deposited by Month**")
+                    monthly_df = sqlfx.monthly_totals("deposits", filters, ctx)
+                    st.altair_chart(
+                        alt.Chart(monthly_df)
+                        .mark_bar(color="#2ca02c", cornerRadiusTopLeft=3, cornerRadiusTopRight=3)
+                        .encode(
+                            x=alt.X("Month:O", title="Month", axis=alt.Axis(grid=False, labelAngle=-45)),
+                            y=alt.Y("Amount:Q", title="Amount (UGX)", axis=alt.Axis(grid=False, format=".2s")),
+                            tooltip=[alt.Tooltip("Month:O"), alt.Tooltip("Amount:Q", format=",.0f")],
+                        )
+                        .properties(height=250),
+                        use_container_width=True,
+                    )
                 # Sort months chronologically from newest to oldest
                 deposits_df_sorted = deposits_df.sort_values("Date", ascending=False)
                 unique_months_list = (
@@ -1272,26 +1321,17 @@ if authentication_status:
                         current_user,
                     ]
 
-                    with st.spinner("Saving deposit data..."):
-                        pepper_workbook = gc.open_by_key(st.secrets["sheet_key"])
-                        deposits_sheet = pepper_workbook.worksheet("Deposits")
-                        next_row_index = len(deposits_sheet.get_all_values()) + 1
-                        deposits_sheet.append_rows(
-                            [data],
-                            value_input_option="user_entered",
-                            insert_data_option="insert_rows",
-                            table_range=f"a{next_row_index}",
-                        )
-                        st.success(
-                            "✅ Deposit Saved Successfully. Feel free to close the application"
-                        )
+                    qfx.enqueue("deposits", "sheet_key", "Deposits", data)
+                    st.success(
+                        "✅ Deposit Saved Successfully. Feel free to close the application"
+                    )
 
     # ===================== WITHDRAWS =====================
     elif nav_bar == "Withdraws":
         if current_user != "Victor Tindimwebwa":
             withdraws, withdraw_form = st.tabs(["➖ Withdraws", "📜 Form"])
 
-            withdraw_df = wfx.load_withdraws()
+            withdraw_df = ctx.load(wfx.load_withdraws)
             withdraw_df = wfx.filter_data(withdraw_df, "years", years)
             withdraw_df = wfx.filter_data(withdraw_df, "months", months)
             withdraw_df = wfx.filter_data(withdraw_df, "start_date", start_date)
@@ -1300,6 +1340,21 @@ if authentication_status:
             with withdraws:
                 if withdraw_df.empty:
                     st.info("No records match the filteration criteria")
+                gfx.show_record_editor(withdraw_df, "sheet_key", "Withdraws", {}, key="withdraws_editor", voidable=True)
+                if not withdraw_df.empty:
+                    st.markdown("**📅 Withdrawn by Month**")
+                    monthly_df = sqlfx.monthly_totals("withdraws", filters, ctx)
+                    st.altair_chart(
+                        alt.Chart(monthly_df)
+                        .mark_bar(color="#DC143C", cornerRadiusTopLeft=3, cornerRadiusTopRight=3)
+                        .encode(
+                            x=alt.X("Month:O", title="Month", axis=alt.Axis(grid=False, labelAngle=-45)),
+                            y=alt.Y("Amount:Q", title="Amount (UGX)", axis=alt.Axis(grid=False, format=".2s")),
+                            tooltip=[alt.Tooltip("Month:O"), alt.Tooltip("Amount:Q", format=",.0f")],
+                        )
+                        .properties(height=250),
+                        use_container_width=True,
+                    )
                 # Sort months chronologically from newest to oldest
                 withdraw_df_sorted = withdraw_df.sort_values("Date", ascending=False)
                 unique_months_list = (
@@ -1344,34 +1399,25 @@ if authentication_status:
                             current_user,
                         ]
 
-                        with st.spinner("Saving withdraw data..."):
-                            pepper_workbook = gc.open_by_key(st.secrets["sheet_key"])
-                            withdraws_sheet = pepper_workbook.worksheet("Withdraws")
-                            next_row_index = len(withdraws_sheet.get_all_values()) + 1
-                            withdraws_sheet.append_rows(
-                                [data],
-                                value_input_option="user_entered",
-                                insert_data_option="insert_rows",
-                                table_range=f"a{next_row_index}",
-                            )
-                            st.success(
-                                "✅ Withdraw Saved Successfully. Feel free to close the application"
-                            )
+                        qfx.enqueue("withdraws", "sheet_key", "Withdraws", data)
+                        st.success(
+                            "✅ Withdraw Saved Successfully. Feel free to close the application"
+                        )
 
     # ===================== HARVESTS =====================
     elif nav_bar == "Harvests":
         st.title("🌱 Harvest Management")
         
         # Load customers for the form
-        customers_list = cusfx.load_customers()
+        customers_list = cusfx.get_customer_names(ctx)
         
         # Create tabs for different harvest operations
         tab1, tab2, tab3 = st.tabs(["📊 Overview", "📋 Harvest List", "➕ Add Harvest"])
         
         with tab1:
             # Load combined data for overview
-            harvests_df = hfx.load_all_harvests_data()
-            detailed_df = hfx.load_new_harvests_data()
+            harvests_df = arcfx.load(hfx.load_all_harvests_data, years, ctx)
+            detailed_df = ctx.load(hfx.load_new_harvests_data)
             
             # Apply filters to both datasets
             if not harvests_df.empty:
@@ -1389,12 +1435,12 @@ if authentication_status:
                 detailed_df = hfx.filter_data(detailed_df, "end_date", end_date)
             
             # Display overview
-            hfx.display_harvests_overview(harvests_df, detailed_df)
+            hfx.display_harvests_overview(harvests_df, detailed_df, ctx, filters)
         
         with tab2:
             # Load combined data for list
-            harvests_df = hfx.load_all_harvests_data()
-            detailed_df = hfx.load_new_harvests_data()
+            harvests_df = arcfx.load(hfx.load_all_harvests_data, years, ctx)
+            detailed_df = ctx.load(hfx.load_new_harvests_data)
             
             # Apply filters to both datasets
             if not harvests_df.empty:
@@ -1411,6 +1457,11 @@ if authentication_status:
                 detailed_df = hfx.filter_data(detailed_df, "start_date", start_date)
                 detailed_df = hfx.filter_data(detailed_df, "end_date", end_date)
             
+            gfx.show_record_editor(
+                detailed_df, "harvest_sheet_key", "Final Harvests", hfx.EDITABLE_COLUMNS, key="harvests_editor",
+                totals=hfx.TOTAL_COLUMNS,
+            )
+
             # Display list with line performance
             hfx.display_harvests_list(harvests_df, detailed_df)
         
@@ -1418,6 +1469,24 @@ if authentication_status:
             # Display harvest form
             hfx.create_harvest_form(current_user, customers_list)
 
+    # ---- Fetch report ----
+    ctx.close()
+    if st.secrets.get("show_fetch_stats", False):
+        with st.sidebar:
+            st.caption(
+                f"Sheets reads this run: {ctx.total_remote_fetches()}"
+                + (f" (repeated: {', '.join(ctx.refetched_tabs())})" if ctx.refetched_tabs() else "")
+                + f" · reads shared between sessions since start: {sum(shfx.get_coalesced_counts().values())}"
+            )
+            for kind, metrics in shfx.get_call_metrics().items():
+                if metrics["calls"]:
+                    st.caption(
+                        f"Sheets {kind}s: {metrics['calls']} calls, "
+                        f"avg {metrics['seconds'] / metrics['calls']:.2f}s (max {metrics['max_seconds']:.2f}s), "
+                        f"{metrics['retries']} retries, {metrics['failures']} failures, "
+                        f"{metrics['throttled_seconds']:.0f}s throttled"
+                    )
+
     # ---- Logout ----
     authenticator.logout("Logout", "sidebar", key="unique_key")
 
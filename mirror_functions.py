@@ -0,0 +1,260 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+
+import sheets_functions as shfx
+
+# Tabs kept as a local Parquet copy: dataset -> [(secret name, tab title, evaluate_formulas)].
+# evaluate_formulas must match what the loaders ask for, otherwise reads go to Sheets.
+MIRRORED_TABS = {
+    "costs": [("cost_sheet_key", "Costs", False)],
+    "sales": [("sales_sheet_key", "Final Sales", True)],
+    "deposits": [("sheet_key", "Deposits", False)],
+    "withdraws": [("sheet_key", "Withdraws", False)],
+    "customers": [("sheet_key", "Customers", False)],
+    "harvests": [("harvest_sheet_key", "Final Harvests", False)],
+}
+
+# How often the background thread re-downloads each dataset
+REFRESH_SECONDS = 300
+
+# A mirror older than this (refresher stopped, Sheets down) is not served any more
+MAX_AGE_SECONDS = 3 * REFRESH_SECONDS
+
+_lock = threading.RLock()
+_wake = threading.Event()
+_worker = None
+
+# Bumped by refresh(); a dataset is served from disk only once a refresh that
+# started after the last bump has finished, so users always see their own writes
+_dirty_generations = {}
+_clean_generations = {}
+
+_refreshed_at = {}
+_errors = {}
+
+# (secret name, evaluate_formulas) -> workbook revision the mirror files were written at
+_revisions = {}
+
+# path -> (mtime, grid) so a file is only parsed again after it is rewritten
+_grids = {}
+
+
+def get_mirror_dir() -> Path:
+    return Path(st.secrets.get("mirror_dir", ".anjo_mirror"))
+
+
+def _tab_path(secret_name: str, title: str) -> Path:
+    slug = "".join(c if c.isalnum() else "_" for c in f"{secret_name}__{title}")
+    return get_mirror_dir() / f"{slug}.parquet"
+
+
+def _find_tab(secret_name: str, title: str):
+    for dataset, tabs in MIRRORED_TABS.items():
+        for tab in tabs:
+            if tab[0] == secret_name and tab[1] == title:
+                return dataset, tab[2]
+    return None, None
+
+
+def _write_grid(path: Path, values):
+    # One JSON row per sheet row, exactly as the API returned it (native cell
+    # values, trailing empty cells trimmed), so row hashes match either source
+    grid_df = pd.DataFrame({"row_json": [json.dumps(row) for row in values]}, dtype=str)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    grid_df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def _read_grid(path: Path):
+    """Return ``(mtime, grid)`` of a mirror file, or None; the mtime is when its
+    content was last confirmed against the sheet (see refresh_now)."""
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+
+    with _lock:
+        cached = _grids.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached
+
+    grid_df = pd.read_parquet(path)
+    if "row_json" not in grid_df.columns:
+        # Written by an older version; served from Sheets until it is refreshed
+        return None
+    grid = [json.loads(row) for row in grid_df["row_json"]]
+
+    with _lock:
+        _grids[path] = (mtime, grid)
+
+    return mtime, grid
+
+
+def get_age(dataset: str):
+    """Seconds since the dataset's mirror was last checked against the sheet, or None if it has none."""
+    ages = []
+    for secret_name, title, _ in MIRRORED_TABS[dataset]:
+        try:
+            ages.append(time.time() - _tab_path(secret_name, title).stat().st_mtime)
+        except FileNotFoundError:
+            return None
+    return max(ages)
+
+
+def get_ages():
+    return {dataset: get_age(dataset) for dataset in MIRRORED_TABS}
+
+
+def get_last_error(dataset: str):
+    return _errors.get(dataset)
+
+
+def _is_servable(dataset: str) -> bool:
+    with _lock:
+        if _dirty_generations.get(dataset, 0) != _clean_generations.get(dataset, 0):
+            return False
+    age = get_age(dataset)
+    return age is not None and age <= MAX_AGE_SECONDS
+
+
+def _read_local(secret_name: str, title: str, start_row: int, evaluate_formulas: bool):
+    dataset, mirrored_render = _find_tab(secret_name, title)
+
+    if dataset is None or mirrored_render != evaluate_formulas or not _is_servable(dataset):
+        return None
+
+    read = _read_grid(_tab_path(secret_name, title))
+    if read is None:
+        return None
+
+    mtime, grid = read
+    shfx.note_read_at(mtime)
+    return grid[max(start_row, 1) - 1:]
+
+
+def read_values_batch(secret_name: str, requests, evaluate_formulas: bool = False):
+    """Same contract as shfx.batch_get_values; tabs with a usable local mirror are
+    served from disk and all the others come back in one batchGet."""
+    results = []
+    for request in requests:
+        title, start_row, columns = shfx.split_request(request)
+        grid = _read_local(secret_name, title, start_row, evaluate_formulas)
+        results.append(None if grid is None else shfx.project_columns(grid, columns))
+
+    remote = [i for i, grid in enumerate(results) if grid is None]
+    if remote:
+        grids = shfx.batch_get_values(secret_name, [requests[i] for i in remote], evaluate_formulas)
+        for i, grid in zip(remote, grids):
+            results[i] = grid
+
+    return results
+
+
+def read_values(secret_name: str, title: str, start_row: int = 1, evaluate_formulas: bool = False):
+    """Same contract as shfx.get_values, served from the local mirror when it is usable."""
+    return read_values_batch(secret_name, [(title, start_row)], evaluate_formulas)[0]
+
+
+def refresh_now(*datasets):
+    """Download every tab of the given datasets and rewrite their mirror files
+    (blocking). Tabs that live in the same workbook are read in one batchGet.
+
+    The workbook's revision is checked first: if nothing changed since the
+    files were written (and no form wrote to it since), the files are only
+    touched, so an idle sheet costs one metadata call instead of a download.
+    Without a revision (no Drive access) every refresh downloads the tabs.
+    Either way the files' mtime is set to when the check started, i.e. the
+    time their content is known to match the sheet.
+    """
+    with _lock:
+        generations = {dataset: _dirty_generations.get(dataset, 0) for dataset in datasets}
+        dirty = {dataset for dataset in datasets if generations[dataset] != _clean_generations.get(dataset, 0)}
+
+    groups = {}
+    for dataset in datasets:
+        for secret_name, title, evaluate_formulas in MIRRORED_TABS[dataset]:
+            groups.setdefault((secret_name, evaluate_formulas), []).append((dataset, title))
+
+    failed = set()
+    for (secret_name, evaluate_formulas), tabs in groups.items():
+        paths = [_tab_path(secret_name, title) for _, title in tabs]
+        try:
+            # Read before the download, so a change made during it shows up next time
+            checked_at = time.time()
+            revision = shfx.get_revision(secret_name)
+            unchanged = (
+                revision is not None
+                and revision == _revisions.get((secret_name, evaluate_formulas))
+                and not any(dataset in dirty for dataset, _ in tabs)
+                and all(path.exists() for path in paths)
+            )
+
+            if not unchanged:
+                grids = shfx.batch_get_values(secret_name, [(title, 1) for _, title in tabs], evaluate_formulas)
+                for path, values in zip(paths, grids):
+                    _write_grid(path, values)
+                _revisions[(secret_name, evaluate_formulas)] = revision
+            for path in paths:
+                os.utime(path, (checked_at, checked_at))
+        except Exception as e:
+            for dataset, _ in tabs:
+                failed.add(dataset)
+                _errors[dataset] = f"{type(e).__name__}: {e}"
+
+    with _lock:
+        for dataset in datasets:
+            if dataset in failed:
+                continue
+            _clean_generations[dataset] = generations[dataset]
+            _refreshed_at[dataset] = time.time()
+            _errors.pop(dataset, None)
+
+
+def refresh(dataset: str):
+    """Forced-refresh hook for forms: stop serving the mirror of ``dataset``
+    until the background thread has re-downloaded it."""
+    with _lock:
+        _dirty_generations[dataset] = _dirty_generations.get(dataset, 0) + 1
+    _wake.set()
+
+
+def _needs_refresh(dataset: str) -> bool:
+    with _lock:
+        if _dirty_generations.get(dataset, 0) != _clean_generations.get(dataset, 0):
+            return True
+    age = get_age(dataset)
+    return age is None or age >= REFRESH_SECONDS
+
+
+def _is_on_sheets(dataset: str) -> bool:
+    # Workbooks moved to another backend (see storefx) have nothing to mirror
+    backends = st.secrets.get("storage_backends", {})
+    return all(backends.get(secret_name, "sheets") == "sheets" for secret_name, _, _ in MIRRORED_TABS[dataset])
+
+
+def _run():
+    while True:
+        due = [dataset for dataset in MIRRORED_TABS if _is_on_sheets(dataset) and _needs_refresh(dataset)]
+        if due:
+            refresh_now(*due)
+
+        _wake.wait(timeout=30)
+        _wake.clear()
+
+
+def start():
+    """Start the background refresher once per process (safe to call on every rerun)."""
+    global _worker
+
+    with _lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name="anjo-mirror", daemon=True)
+            _worker.start()
@@ -0,0 +1,237 @@
+import json
+import random
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+import streamlit as st
+
+import cache_functions as cachefx
+import sheets_functions as shfx
+import storage_functions as storefx
+
+# Seconds the worker waits after a submission so rows from other users can
+# join the same append_rows call
+FLUSH_DELAY_SECONDS = 2
+
+# Retry backoff: 2, 4, 8 ... seconds (with jitter), capped
+MAX_BACKOFF_SECONDS = 300
+
+# After this many failed attempts a row is parked as "failed" until retried by hand
+MAX_ATTEMPTS = 8
+
+# How long a form waits for its own row to reach the sheet before rerunning
+WAIT_SECONDS = 10
+
+# Rows claimed by a worker ("inflight") go back to "pending" if it has not
+# finished with them after this long, e.g. because its process died
+LEASE_SECONDS = 600
+
+_lock = threading.Lock()
+_wake = threading.Event()
+_worker = None
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    dataset TEXT NOT NULL,
+    secret_name TEXT NOT NULL,
+    title TEXT NOT NULL,
+    first_data_row INTEGER NOT NULL,
+    row_json TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    last_error TEXT,
+    claimed_at REAL
+);
+CREATE INDEX IF NOT EXISTS submissions_due ON submissions (status, next_attempt_at);
+"""
+
+
+def _connect():
+    connection = sqlite3.connect(st.secrets.get("queue_path", ".anjo_queue.sqlite3"), timeout=10)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript(_SCHEMA)
+    # Queues created before rows were claimed
+    columns = [row[1] for row in connection.execute("PRAGMA table_info(submissions)")]
+    if "claimed_at" not in columns:
+        try:
+            connection.execute("ALTER TABLE submissions ADD COLUMN claimed_at REAL")
+        except sqlite3.OperationalError:
+            # Another process added it first
+            pass
+    return connection
+
+
+def enqueue(dataset: str, secret_name: str, title: str, row, first_data_row: int = 2) -> int:
+    """Durably queue one row for appending to a tab and return its queue id.
+
+    Returns as soon as the row is on local disk; the background worker appends
+    it to the sheet and then invalidates ``dataset`` so pages pick it up.
+    """
+    with closing(_connect()) as connection, connection:
+        cursor = connection.execute(
+            "INSERT INTO submissions (dataset, secret_name, title, first_data_row, row_json, created_at, next_attempt_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (dataset, secret_name, title, first_data_row, json.dumps(list(row)), time.time(), time.time()),
+        )
+        submission_id = cursor.lastrowid
+
+    start()
+    _wake.set()
+
+    return submission_id
+
+
+def wait(submission_id: int, timeout: float = WAIT_SECONDS) -> bool:
+    """Block until a queued row has been appended (True), or has failed or
+    the timeout ran out (False), so a form can rerun onto its own write."""
+    deadline = time.monotonic() + timeout
+    while True:
+        with closing(_connect()) as connection:
+            row = connection.execute("SELECT status FROM submissions WHERE id = ?", (submission_id,)).fetchone()
+        if row is None:
+            return True
+        if row[0] == "failed" or time.monotonic() >= deadline:
+            return False
+        time.sleep(0.2)
+
+
+def get_depths():
+    """Return (pending, failed) queue depths; rows being appended count as pending."""
+    with closing(_connect()) as connection:
+        counts = dict(connection.execute("SELECT status, COUNT(*) FROM submissions GROUP BY status").fetchall())
+
+    return counts.get("pending", 0) + counts.get("inflight", 0), counts.get("failed", 0)
+
+
+def get_failed():
+    with closing(_connect()) as connection:
+        return connection.execute(
+            "SELECT id, dataset, title, row_json, attempts, last_error FROM submissions "
+            "WHERE status = 'failed' ORDER BY id"
+        ).fetchall()
+
+
+def retry_failed():
+    """Put every failed row back in the queue for another round of attempts."""
+    with closing(_connect()) as connection, connection:
+        connection.execute(
+            "UPDATE submissions SET status = 'pending', attempts = 0, next_attempt_at = ? WHERE status = 'failed'",
+            (time.time(),),
+        )
+    _wake.set()
+
+
+def _backoff(attempts: int) -> float:
+    return min(MAX_BACKOFF_SECONDS, 2 ** attempts) * random.uniform(0.5, 1.5)
+
+
+def _claim_due(connection):
+    # One write transaction, so workers in other processes never claim the same rows
+    now = time.time()
+    with connection:
+        connection.execute("BEGIN IMMEDIATE")
+        connection.execute(
+            "UPDATE submissions SET status = 'pending', claimed_at = NULL WHERE status = 'inflight' AND claimed_at <= ?",
+            (now - LEASE_SECONDS,),
+        )
+        due = connection.execute(
+            "UPDATE submissions SET status = 'inflight', claimed_at = ? "
+            "WHERE status = 'pending' AND next_attempt_at <= ? "
+            "RETURNING id, dataset, secret_name, title, first_data_row, row_json, attempts",
+            (now, now),
+        ).fetchall()
+
+    return sorted(due)
+
+
+def flush():
+    """Append every due row, one append_rows call per tab. Returns rows written."""
+    with closing(_connect()) as connection:
+        due = _claim_due(connection)
+
+        groups = {}
+        for submission in due:
+            groups.setdefault((submission[2], submission[3], submission[4]), []).append(submission)
+
+        written = 0
+        for (secret_name, title, first_data_row), submissions in groups.items():
+            ids = [submission[0] for submission in submissions]
+            try:
+                storefx.append_rows(
+                    secret_name,
+                    title,
+                    [json.loads(submission[5]) for submission in submissions],
+                    first_data_row=first_data_row,
+                )
+            except Exception as e:
+                with connection:
+                    for submission in submissions:
+                        attempts = submission[6] + 1
+                        # The rows may be in the sheet already: resending could add them twice
+                        if isinstance(e, shfx.WriteUncertain):
+                            attempts = MAX_ATTEMPTS
+                        connection.execute(
+                            "UPDATE submissions SET attempts = ?, next_attempt_at = ?, last_error = ?, status = ?, "
+                            "claimed_at = NULL WHERE id = ?",
+                            (
+                                attempts,
+                                time.time() + _backoff(attempts),
+                                f"{type(e).__name__}: {e}",
+                                "failed" if attempts >= MAX_ATTEMPTS else "pending",
+                                submission[0],
+                            ),
+                        )
+                continue
+
+            with connection:
+                connection.executemany("DELETE FROM submissions WHERE id = ?", [(i,) for i in ids])
+            written += len(ids)
+
+            for dataset in set(submission[1] for submission in submissions):
+                cachefx.invalidate(dataset)
+
+    return written
+
+
+def _next_due_in():
+    with closing(_connect()) as connection:
+        (next_attempt_at,) = connection.execute(
+            "SELECT MIN(CASE status WHEN 'pending' THEN next_attempt_at ELSE claimed_at + ? END) "
+            "FROM submissions WHERE status IN ('pending', 'inflight')",
+            (LEASE_SECONDS,),
+        ).fetchone()
+
+    if next_attempt_at is None:
+        return None
+    return max(0.0, next_attempt_at - time.time())
+
+
+def _run():
+    while True:
+        _wake.wait(timeout=_next_due_in())
+        _wake.clear()
+
+        # Let concurrent submissions pile up into the same batch
+        time.sleep(FLUSH_DELAY_SECONDS)
+
+        try:
+            flush()
+        except Exception:
+            # Local database trouble; try again on the next wake-up
+            time.sleep(FLUSH_DELAY_SECONDS)
+
+
+def start():
+    """Start the flush worker once per process; rows left over from a previous run are sent too."""
+    global _worker
+
+    with _lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name="anjo-queue", daemon=True)
+            _worker.start()
+            _wake.set()
@@ -4,8 +4,10 @@ from typing import List
 
 import pandas as pd
 import streamlit as st
-from gspread_dataframe import get_as_dataframe
-import gspread
+
+import archive_functions as arcfx
+import cache_functions as cachefx
+import sql_functions as sqlfx
 
 
 @st.cache_data
@@ -140,8 +142,10 @@ def clean_sales_df(sales_df: pd.DataFrame) -> pd.DataFrame:
     return sales_df
 
 
-
-
+cachefx.register_tab(
+    "sales", "sales_sheet_key", "Final Sales", clean_sales_df, evaluate_formulas=True, tombstones=True,
+    archive="sales", dtype=str, columns=["Date", "Customer", "Size", "Quantity", "Unit", "Unit Price", "Total Price"],
+)
 
 
 def process_customer(sales_df, customer):
@@ -175,17 +179,17 @@ def filter_data(data: pd.DataFrame, filter_name: str, values: List[str]) -> pd.D
         data = data[data['Date'].dt.month.isin(values)]
 
     if filter_name == "customers":
-        data = data[data['Customer'].isin(values)]
+        # Names come from the casefold-deduplicated customer index
+        wanted = [value.casefold() for value in values]
+        data = data[data['Customer'].astype(str).str.casefold().isin(wanted)]
 
     if filter_name == "start_date":
-        date_string = str(values)
-        formatted_start_date = datetime.datetime.strptime(date_string, "%Y-%m-%d").strftime("%d/%m/%Y")
-        data = data[data['Date'] >= formatted_start_date]
+        # Compared as dates, like sqlfx's WHERE clause (not as dd/mm/yyyy text)
+        data = data[data['Date'] >= pd.Timestamp(str(values))]
 
     if filter_name == "end_date":
-        date_string = str(values)
-        formatted_start_date = datetime.datetime.strptime(date_string, "%Y-%m-%d").strftime("%d/%m/%Y")
-        data = data[data['Date'] <= formatted_start_date]
+        # The whole end day counts, times included
+        data = data[data['Date'] < pd.Timestamp(str(values)) + pd.Timedelta(days=1)]
 
     return data
 
@@ -199,11 +203,42 @@ def convert_date_range(date_tuple):
     return converted_dates
 
 
+@cachefx.cached(
+    "sales", snapshot=1, stale_while_revalidate=True,
+    schema={
+        "Date": "datetime64[ns]", "Customer": object, "Size": object, "Quantity": "float64",
+        "Unit": object, "Unit Price": "float64", "Total Price": "float64",
+    },
+)
 def get_sales_df():
-    sales_df = load_sales_df()
-    cleaned_sales_df = clean_sales_df(sales_df)
-
-    return cleaned_sales_df
+    # Only rows appended since the last read are fetched (see cachefx.load_tab)
+    return arcfx.freeze_closed_years("sales", cachefx.load_tab("sales_sheet_key", "Final Sales"))
+
+
+arcfx.register("sales", get_sales_df)
+
+# Record column -> (sheet column, to_cell) for gfx.show_record_editor.
+# Total Price is not editable; it is recomputed from TOTAL_COLUMNS instead.
+EDITABLE_COLUMNS = {
+    "Date": ("Date", lambda date: date.strftime("%d/%m/%Y")),
+    "Customer": ("Customer", None),
+    "Size": ("Size", None),
+    "Quantity": ("Quantity", None),
+    "Unit": ("Unit", None),
+    "Unit Price": ("Unit Price", None),
+}
+
+# Record column -> (sheet column, inputs, compute) for gfx.show_record_editor
+TOTAL_COLUMNS = {
+    "Total Price": (
+        "Total Price", ("Quantity", "Unit Price"),
+        lambda record: pd.to_numeric(record[["Quantity", "Unit Price"]], errors="coerce").prod(min_count=2),
+    ),
+}
+sqlfx.register_table(
+    "sales", get_sales_df,
+    date="Date", customer="Customer", quantity="Quantity", revenue="Total Price",
+)
 
 
 # def load_sales_df():
@@ -217,29 +252,6 @@ def get_sales_df():
 #
 #     return sales_df
 
-def load_sales_df():
-    sheet_credentials = st.secrets["sheet_credentials"]
-    gc = gspread.service_account_from_dict(sheet_credentials)
-
-    # If using a key, use open_by_key; if a full URL, use open_by_url
-    anjo_sales_workbook = gc.open_by_url(st.secrets["sales_sheet_key"])
-    sales_sheet = anjo_sales_workbook.worksheet("Final Sales")
-
-    # Pull raw; don’t rely on parse_dates here—do deterministic parsing later
-    sales_df = get_as_dataframe(sales_sheet, evaluate_formulas=True, dtype=str)
-    return sales_df
-
-
-def get_customers():
-    sales_df = load_sales_df()
-
-    customers_df = sales_df.loc[:, ["customer"]].dropna()
-    unique_customers = customers_df["customer"].unique()
-    unique_customers.sort()
-
-    return unique_customers
-
-
 def get_units():
     units = [
         "kg"
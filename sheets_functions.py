@@ -0,0 +1,554 @@
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+import gspread
+import pandas as pd
+import requests
+import streamlit as st
+from gspread.urls import DRIVE_FILES_API_V3_URL
+from gspread.utils import absolute_range_name, rowcol_to_a1
+from pandas.io.parsers import TextParser
+
+# One authorised client per process. gspread keeps the OAuth token on the
+# client's session and refreshes it when it expires, so every loader and form
+# shares a single key parse and token instead of doing a handshake per call.
+_lock = threading.RLock()
+_client = None
+
+# Opened handles, keyed by the sheet key/URL stored in st.secrets (and tab title)
+_workbooks = {}
+_worksheets = {}
+
+# Per-thread Counter of values requests by tab title; set by a DatasetContext for
+# the script run on this thread, None (not counting) everywhere else
+_fetch_counters = threading.local()
+
+# Per-thread list of the times the sheet data used on this thread was read
+# from Sheets; set while a cached loader runs (see track_read_times)
+_read_times = threading.local()
+
+# (sheet reference, ranges, render options) -> Future of the values request in
+# flight, so identical concurrent reads from several sessions share one call
+_in_flight = {}
+
+# Tab title -> reads that were served by joining another caller's request
+_coalesced = Counter()
+
+# Per-minute Sheets API quota of one service account ("read" and "write"
+# requests are metered separately). Calls beyond it wait for a token instead
+# of being sent and answered with a 429.
+REQUESTS_PER_MINUTE = {"read": 60, "write": 60}
+
+# Transient failures (429, 5xx, dropped connections) are retried this many
+# times, waiting 1, 2, 4 ... seconds (with jitter, capped) in between. Writes
+# are only retried on a 429, which is refused before anything is applied;
+# a write that timed out or failed with a 5xx may have gone through.
+MAX_RETRIES = 5
+MAX_BACKOFF_SECONDS = 32
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class SheetsUnavailable(Exception):
+    """Google Sheets kept refusing or failing a request; trying again later may work."""
+
+
+class WriteUncertain(SheetsUnavailable):
+    """A write failed in a way that does not tell whether Sheets applied it."""
+
+
+class _TokenBucket:
+    def __init__(self, per_minute: int):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.tokens = float(per_minute)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take a token, sleeping until one is available; returns the seconds waited."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+_buckets = {kind: _TokenBucket(per_minute) for kind, per_minute in REQUESTS_PER_MINUTE.items()}
+
+# kind -> {"calls", "retries", "failures", "throttled_seconds", "seconds", "max_seconds"}
+_metrics = {
+    kind: Counter(calls=0, retries=0, failures=0, throttled_seconds=0.0, seconds=0.0, max_seconds=0.0)
+    for kind in REQUESTS_PER_MINUTE
+}
+
+
+def get_call_metrics():
+    """Per-kind totals of the calls made through ``call``: count, retries, failures and latency."""
+    with _lock:
+        return {kind: dict(metrics) for kind, metrics in _metrics.items()}
+
+
+def _is_transient(error) -> bool:
+    if isinstance(error, gspread.exceptions.APIError):
+        return error.response.status_code in RETRYABLE_STATUSES
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+def _is_retryable(kind: str, error) -> bool:
+    if kind == "read":
+        return _is_transient(error)
+    return isinstance(error, gspread.exceptions.APIError) and error.response.status_code == 429
+
+
+def call(kind: str, function, *args, **kwargs):
+    """Run one Google API request through the quota gate.
+
+    Every request in the app goes through here: it waits for a token of its
+    ``kind`` ("read" or "write"), retries transient failures with jittered
+    exponential backoff and records latency. When the retries run out it
+    raises SheetsUnavailable, so pages can say so instead of showing no data.
+    A write that may have been applied raises WriteUncertain straight away.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        throttled = _buckets[kind].acquire()
+        started_at = time.monotonic()
+        try:
+            result = function(*args, **kwargs)
+        except Exception as e:
+            retryable = _is_retryable(kind, e)
+            with _lock:
+                _metrics[kind]["throttled_seconds"] += throttled
+                if not retryable or attempt == MAX_RETRIES:
+                    _metrics[kind]["failures"] += 1
+                else:
+                    _metrics[kind]["retries"] += 1
+            if not retryable and _is_transient(e):
+                raise WriteUncertain("Google Sheets did not confirm the write; it may or may not have been saved.") from e
+            if not retryable:
+                raise
+            if attempt == MAX_RETRIES:
+                raise SheetsUnavailable(
+                    "Google Sheets is busy or unavailable right now. Please try again in a minute."
+                ) from e
+            time.sleep(min(MAX_BACKOFF_SECONDS, 2 ** attempt) * random.uniform(0.5, 1.5))
+            continue
+
+        elapsed = time.monotonic() - started_at
+        with _lock:
+            metrics = _metrics[kind]
+            metrics["calls"] += 1
+            metrics["throttled_seconds"] += throttled
+            metrics["seconds"] += elapsed
+            metrics["max_seconds"] = max(metrics["max_seconds"], elapsed)
+
+        return result
+
+
+def get_client():
+    """Return the shared gspread client, authorising it on first use."""
+    global _client
+
+    with _lock:
+        if _client is None:
+            _client = gspread.service_account_from_dict(st.secrets["sheet_credentials"])
+
+        return _client
+
+
+def get_workbook(secret_name: str):
+    """Return the Spreadsheet behind ``st.secrets[secret_name]``.
+
+    The secrets hold either a bare key (``sheet_key``, ``cost_sheet_key``) or a
+    full URL (``sales_sheet_key``, ``harvest_sheet_key``); both are accepted.
+    """
+    reference = st.secrets[secret_name]
+
+    with _lock:
+        workbook = _workbooks.get(reference)
+    if workbook is not None:
+        return workbook
+
+    # Opened outside the lock, since a throttled or retried call can take a while
+    client = get_client()
+    if reference.startswith("http"):
+        workbook = call("read", client.open_by_url, reference)
+    else:
+        workbook = call("read", client.open_by_key, reference)
+
+    with _lock:
+        return _workbooks.setdefault(reference, workbook)
+
+
+def get_worksheet(secret_name: str, title: str):
+    """Return the cached Worksheet handle for a tab of a secrets workbook."""
+    reference = st.secrets[secret_name]
+
+    with _lock:
+        worksheet = _worksheets.get((reference, title))
+    if worksheet is not None:
+        return worksheet
+
+    # WorksheetNotFound propagates and nothing is cached
+    worksheet = call("read", get_workbook(secret_name).worksheet, title)
+
+    with _lock:
+        return _worksheets.setdefault((reference, title), worksheet)
+
+
+def forget_handles(secret_name: str = None):
+    """Drop cached handles (all of them, or those of one workbook) so the next
+    call reopens them, e.g. after a tab has been renamed or recreated."""
+    with _lock:
+        if secret_name is None:
+            _workbooks.clear()
+            _worksheets.clear()
+            return
+
+        reference = st.secrets[secret_name]
+        _workbooks.pop(reference, None)
+        for key in [key for key in _worksheets if key[0] == reference]:
+            del _worksheets[key]
+
+
+def count_fetches(counter):
+    """Count the tabs read by this thread from now on into ``counter`` (None to stop)."""
+    _fetch_counters.counter = counter
+
+
+def get_fetch_counter():
+    return getattr(_fetch_counters, "counter", None)
+
+
+def _count_fetch(titles):
+    counter = get_fetch_counter()
+    if counter is not None:
+        # Prefetch threads of one run share its counter
+        with _lock:
+            for title in titles:
+                counter[title] += 1
+
+
+def track_read_times(times):
+    """Append to the list ``times`` when each piece of sheet data this thread
+    uses from now on was read from Sheets (None to stop). Returns the list
+    tracked before, to put back afterwards."""
+    previous = getattr(_read_times, "times", None)
+    _read_times.times = times
+    return previous
+
+
+def note_read_at(timestamp):
+    """Record that data used by this thread was read from Sheets at ``timestamp``
+    (e.g. a local copy of it), see track_read_times."""
+    times = getattr(_read_times, "times", None)
+    if times is not None and timestamp is not None:
+        times.append(timestamp)
+
+
+def get_revision(secret_name: str):
+    """Return a cheap token that changes whenever the workbook does, or None.
+
+    This is the Drive ``modifiedTime`` (one metadata call, no cell data). If
+    the Drive API is not available to the service account there is no such
+    token (sheet metadata such as the row count does not change on a hand
+    edit), so None is returned and callers have to read the cells again.
+    """
+    workbook = get_workbook(secret_name)
+
+    try:
+        response = call(
+            "read",
+            get_client().request,
+            "get",
+            f"{DRIVE_FILES_API_V3_URL}/{workbook.id}",
+            params={"fields": "modifiedTime", "supportsAllDrives": True},
+        )
+        return response.json()["modifiedTime"]
+    except gspread.exceptions.APIError:
+        return None
+
+
+def get_coalesced_counts():
+    with _lock:
+        return Counter(_coalesced)
+
+
+def _single_flight(secret_name: str, ranges, titles, evaluate_formulas: bool, fetch):
+    """Run ``fetch()`` unless the same ranges are already being read, in which
+    case wait for that request and share its result."""
+    key = (st.secrets[secret_name], tuple(ranges), evaluate_formulas)
+    note_read_at(time.time())
+
+    with _lock:
+        future = _in_flight.get(key)
+        leader = future is None
+        if leader:
+            future = _in_flight[key] = Future()
+        else:
+            for title in titles:
+                _coalesced[title] += 1
+
+    if not leader:
+        return future.result()
+
+    try:
+        _count_fetch(titles)
+        future.set_result(fetch())
+    except BaseException as e:
+        future.set_exception(e)
+    finally:
+        with _lock:
+            del _in_flight[key]
+
+    return future.result()
+
+
+def _render_params(evaluate_formulas: bool):
+    # Same rendering as gspread_dataframe.get_as_dataframe, so frames built
+    # from these values parse exactly like the ones the loaders used to get
+    return {
+        "valueRenderOption": "UNFORMATTED_VALUE" if evaluate_formulas else "FORMULA",
+        "dateTimeRenderOption": "FORMATTED_STRING",
+    }
+
+
+def _range_name(secret_name: str, title: str, start_row: int) -> str:
+    if start_row <= 1:
+        return absolute_range_name(title)
+
+    worksheet = get_worksheet(secret_name, title)
+    last_column = rowcol_to_a1(1, worksheet.col_count).rstrip("0123456789")
+    return absolute_range_name(title, f"A{start_row}:{last_column}")
+
+
+def _column_letter(index: int) -> str:
+    return rowcol_to_a1(1, index + 1).rstrip("0123456789")
+
+
+def _column_runs(columns):
+    # Adjacent columns are fetched as one range: [3, 0, 1, 7] -> [[0, 1], [3, 3], [7, 7]]
+    runs = []
+    for column in sorted(set(columns)):
+        if runs and column == runs[-1][1] + 1:
+            runs[-1][1] = column
+        else:
+            runs.append([column, column])
+    return runs
+
+
+def _trim(row):
+    while row and row[-1] == "":
+        row.pop()
+    return row
+
+
+def project_columns(values, columns):
+    """Keep only the given 0-based columns of a grid, in that order (None keeps all)."""
+    if columns is None:
+        return values
+    return [_trim([row[column] if column < len(row) else "" for column in columns]) for row in values]
+
+
+def split_request(request):
+    # (title, start_row) or (title, start_row, columns)
+    title, start_row, *rest = request
+    return title, start_row, rest[0] if rest else None
+
+
+def _request_ranges(secret_name: str, title: str, start_row: int, columns):
+    if columns is None:
+        return [_range_name(secret_name, title, start_row)]
+    return [
+        absolute_range_name(title, f"{_column_letter(first)}{max(start_row, 1)}:{_column_letter(last)}")
+        for first, last in _column_runs(columns)
+    ]
+
+
+def _join_runs(columns, run_grids):
+    """Stitch the grids of the column ranges of one request back into rows."""
+    rows = []
+    for position in range(max((len(grid) for grid in run_grids), default=0)):
+        cells = {}
+        for (first, _), grid in zip(_column_runs(columns), run_grids):
+            for offset, value in enumerate(grid[position] if position < len(grid) else []):
+                cells[first + offset] = value
+        rows.append(_trim([cells.get(column, "") for column in columns]))
+    return rows
+
+
+def get_values(secret_name: str, title: str, start_row: int = 1, evaluate_formulas: bool = False):
+    """Return the raw cell grid of a tab from ``start_row`` down to its last filled row."""
+    range_name = _range_name(secret_name, title, start_row)
+    data = _single_flight(
+        secret_name,
+        [range_name],
+        [title],
+        evaluate_formulas,
+        lambda: call(
+            "read", get_workbook(secret_name).values_get, range_name, params=_render_params(evaluate_formulas)
+        ),
+    )
+
+    return data.get("values", [])
+
+
+def batch_get_values(secret_name: str, requests, evaluate_formulas: bool = False):
+    """Read several tabs of one workbook in a single values:batchGet call.
+
+    ``requests`` is a list of ``(title, start_row)``, or ``(title, start_row,
+    columns)`` to fetch only the given 0-based columns (as one range per run
+    of adjacent columns). One grid is returned per request, in the same
+    order, with the same contract as get_values plus project_columns.
+    """
+    if not requests:
+        return []
+
+    requests = [split_request(request) for request in requests]
+    ranges_per_request = [
+        _request_ranges(secret_name, title, start_row, columns) for title, start_row, columns in requests
+    ]
+    range_names = [range_name for ranges in ranges_per_request for range_name in ranges]
+    data = _single_flight(
+        secret_name,
+        range_names,
+        [title for title, _, _ in requests],
+        evaluate_formulas,
+        lambda: call(
+            "read", get_workbook(secret_name).values_batch_get, range_names, params=_render_params(evaluate_formulas)
+        ),
+    )
+
+    run_grids = iter([value_range.get("values", []) for value_range in data.get("valueRanges", [])])
+    grids = []
+    for (_, _, columns), ranges in zip(requests, ranges_per_request):
+        request_grids = [next(run_grids) for _ in ranges]
+        grids.append(request_grids[0] if columns is None else _join_runs(columns, request_grids))
+
+    return grids
+
+
+def values_to_frame(values, **options) -> pd.DataFrame:
+    """Parse a cell grid (header row first) the way get_as_dataframe does."""
+    if not values:
+        return pd.DataFrame()
+
+    # The API trims trailing empty cells, so pad every row out to the widest one
+    width = max(len(row) for row in values)
+    rows = [list(row) + [""] * (width - len(row)) for row in values]
+
+    return TextParser(rows, **options).read()
+
+
+# (sheet reference, tab title) -> last filled row, so appends don't have to
+# download the whole sheet to find where the data ends
+_cursors = {}
+_cursor_locks = {}
+
+
+def _same_cell(read, sent) -> bool:
+    read, sent = str(read).strip(), "" if sent is None else str(sent).strip()
+    if read == sent:
+        return True
+    try:
+        return float(read.replace(",", "")) == float(sent)
+    except ValueError:
+        return False
+
+
+def _same_rows(read_rows, sent_rows) -> bool:
+    return len(read_rows) == len(sent_rows) and all(
+        _same_cell(read[i] if i < len(read) else "", value)
+        for read, sent in zip(read_rows, sent_rows)
+        for i, value in enumerate(sent)
+    )
+
+
+def append_rows(secret_name: str, title: str, rows, first_data_row: int = 2):
+    """Append ``rows`` below the last filled row of a tab and return the first row written.
+
+    The row cursor is found once per process from column A, then validated on
+    every write by reading only the rows below it (normally none), so the cost
+    of saving does not grow with the size of the sheet.
+
+    An append that fails without saying whether it was applied is checked
+    against the rows below the cursor: resent if nothing arrived, taken as
+    done if exactly these rows did, and WriteUncertain otherwise.
+    """
+    worksheet = get_worksheet(secret_name, title)
+    key = (st.secrets[secret_name], title)
+
+    with _lock:
+        cursor_lock = _cursor_locks.setdefault(key, threading.Lock())
+
+    with cursor_lock:
+        last_row = _cursors.get(key)
+        if last_row is None:
+            _count_fetch([title])
+            last_row = len(call("read", worksheet.col_values, 1))
+
+        # Rows written since by other sessions, processes or by hand
+        last_row += len(get_values(secret_name, title, start_row=last_row + 1))
+
+        next_row = max(first_data_row, last_row + 1)
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                call(
+                    "write",
+                    worksheet.append_rows,
+                    rows,
+                    value_input_option="user_entered",
+                    insert_data_option="insert_rows",
+                    table_range=f"a{next_row}",
+                )
+                break
+            except WriteUncertain as e:
+                try:
+                    arrived = get_values(secret_name, title, start_row=next_row)
+                except SheetsUnavailable:
+                    raise e
+                if _same_rows(arrived, rows):
+                    break
+                if arrived or attempt == MAX_RETRIES:
+                    raise
+                time.sleep(min(MAX_BACKOFF_SECONDS, 2 ** attempt) * random.uniform(0.5, 1.5))
+
+        _cursors[key] = next_row + len(rows) - 1
+
+        return next_row
+
+
+def update_rows(secret_name: str, title: str, updates):
+    """Overwrite whole rows of a tab in one batch update; ``updates`` maps sheet row -> cell values."""
+    if not updates:
+        return
+
+    worksheet = get_worksheet(secret_name, title)
+    call(
+        "write",
+        worksheet.batch_update,
+        [{"range": f"A{row}", "values": [list(values)]} for row, values in sorted(updates.items())],
+        value_input_option="user_entered",
+    )
+
+
+def update_cells(secret_name: str, title: str, cells):
+    """Overwrite single cells of a tab in one batch update; ``cells`` maps
+    (sheet row, 0-based column) -> value."""
+    if not cells:
+        return
+
+    worksheet = get_worksheet(secret_name, title)
+    call(
+        "write",
+        worksheet.batch_update,
+        [{"range": rowcol_to_a1(row, column + 1), "values": [[value]]} for (row, column), value in sorted(cells.items())],
+        value_input_option="user_entered",
+    )
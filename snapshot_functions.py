@@ -0,0 +1,109 @@
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+import pyarrow as pa
+import streamlit as st
+
+# Cleaned datasets are published as uncompressed Arrow IPC files and opened
+# memory-mapped, so every Streamlit process on the host shares one copy of
+# the data in the page cache, and a new process is warm without a fetch.
+# A new version is written next to the old one and swapped in with
+# os.replace; readers still mapping the old file keep a valid copy.
+
+# Bump when the way snapshots are written changes; every snapshot on disk is then ignored
+FORMAT_VERSION = 2
+
+_VERSION_KEY = b"anjo_snapshot_version"
+
+_lock = threading.Lock()
+
+# path -> ((inode, mtime_ns), table), so sessions of a process share one mapping per version
+_mapped = {}
+
+
+def get_snapshot_dir() -> Path:
+    return Path(st.secrets.get("snapshot_dir", ".anjo_snapshots"))
+
+
+def _snapshot_path(name: str) -> Path:
+    slug = "".join(c if c.isalnum() else "_" for c in name)
+    return get_snapshot_dir() / f"{slug}.arrow"
+
+
+def _version_tag(schema_version: int) -> bytes:
+    return f"{FORMAT_VERSION}.{schema_version}".encode()
+
+
+def _open(path: Path):
+    """Memory-map the current version of a file; returns (table, written_at)."""
+    stat = path.stat()
+    version = (stat.st_ino, stat.st_mtime_ns)
+
+    with _lock:
+        mapped = _mapped.get(path)
+        if mapped is not None and mapped[0] == version:
+            return mapped[1], stat.st_mtime
+
+    table = pa.ipc.open_file(pa.memory_map(str(path))).read_all()
+
+    with _lock:
+        _mapped[path] = (version, table)
+
+    return table, stat.st_mtime
+
+
+def write_snapshot(name: str, schema_version: int, frame, as_of=None):
+    """Publish a cleaned frame (index included) and return it as a memory-mapped Arrow table.
+
+    ``as_of``, the time the data was read from Sheets, becomes the file's
+    mtime, so readers get it back as ``written_at``. Returns None, leaving
+    any previous version in place, if the frame cannot be stored as Arrow
+    (e.g. a column mixing numbers and text).
+    """
+    try:
+        table = pa.Table.from_pandas(frame)
+    except (pa.ArrowException, TypeError, ValueError):
+        return None
+
+    table = table.replace_schema_metadata(
+        {**(table.schema.metadata or {}), _VERSION_KEY: _version_tag(schema_version)}
+    )
+
+    path = _snapshot_path(name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # A unique name per writer, as threads of one process may publish the same snapshot at once
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        if as_of is not None:
+            os.utime(tmp_path, (as_of, as_of))
+        os.replace(tmp_path, path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+    return _open(path)[0]
+
+
+def read_snapshot(name: str, schema_version: int):
+    """Return ``(table, written_at)`` of the published version, or None if there
+    is none or it was written for another schema version (such files are deleted)."""
+    path = _snapshot_path(name)
+
+    try:
+        table, written_at = _open(path)
+    except FileNotFoundError:
+        return None
+    except (pa.ArrowException, OSError):
+        path.unlink(missing_ok=True)
+        return None
+
+    if (table.schema.metadata or {}).get(_VERSION_KEY) != _version_tag(schema_version):
+        path.unlink(missing_ok=True)
+        return None
+
+    return table, written_at
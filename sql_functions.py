@@ -0,0 +1,180 @@
+import sqlite3
+import threading
+
+import pandas as pd
+
+import archive_functions as arcfx
+
+# Dashboard aggregations run as SQL over an in-memory SQLite copy of the
+# cleaned datasets, so the sidebar filters become WHERE clauses and only the
+# aggregated rows come back into pandas. A table is rebuilt only when its
+# loader returns data read at a different time (the frame's ``attrs["as_of"]``,
+# set by cachefx.cached).
+
+# Column roles: "date" is parsed as a date, these as text, everything else as numbers
+TEXT_COLUMNS = {"category", "customer", "structure"}
+
+_lock = threading.Lock()
+_connection = sqlite3.connect(":memory:", check_same_thread=False)
+
+# table -> (loader, {sql column: frame column})
+_tables = {}
+
+# table -> (as_of, archived years) of the frame it was built from
+_built_from = {}
+
+
+def register_table(table: str, loader, **columns):
+    """Expose a cached loader's frame as an SQL table; ``columns`` maps SQL column -> frame column.
+    Modules register their tables at import, like cachefx.register_tab."""
+    _tables[table] = (loader, columns)
+
+
+def _to_sql_frame(frame, columns):
+    sql_frame = pd.DataFrame(index=frame.index)
+    for name, source in columns.items():
+        values = frame[source] if source in frame else pd.Series(None, index=frame.index, dtype=object)
+        if name == "date":
+            sql_frame[name] = pd.to_datetime(values, errors="coerce").dt.strftime("%Y-%m-%d")
+        elif name in TEXT_COLUMNS:
+            sql_frame[name] = values.astype(str).str.strip()
+        else:
+            sql_frame[name] = pd.to_numeric(values.astype(str).str.replace(",", ""), errors="coerce")
+    return sql_frame
+
+
+def _ensure_table(table: str, ctx=None):
+    loader, columns = _tables[table]
+    # Archived years are part of the table; the WHERE clause does the year filtering
+    frame = arcfx.load(loader, ctx=ctx)
+    as_of = frame.attrs.get("as_of")
+    built_from = (as_of, arcfx.get_archived_years(arcfx.get_name(loader)))
+
+    with _lock:
+        if as_of is not None and _built_from.get(table) == built_from:
+            return
+        _to_sql_frame(frame, columns).to_sql(table, _connection, if_exists="replace", index=False)
+        _connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_date ON {table} (date)")
+        _built_from[table] = built_from
+
+
+def _where(filters, table: str):
+    """Turn the gfx.show_filters values into a WHERE clause and its parameters."""
+    columns = _tables[table][1]
+    clauses, params = [], []
+
+    def add(clause, values):
+        clauses.append(clause.format(", ".join("?" * len(values))))
+        params.extend(values)
+
+    if filters.get("years"):
+        add("CAST(strftime('%Y', date) AS INTEGER) IN ({})", list(filters["years"]))
+    if filters.get("months"):
+        add("CAST(strftime('%m', date) AS INTEGER) IN ({})", list(filters["months"]))
+    if filters.get("cost_categories") and "category" in columns:
+        add("category IN ({})", list(filters["cost_categories"]))
+    if filters.get("customers") and "customer" in columns:
+        add("lower(customer) IN ({})", [customer.casefold() for customer in filters["customers"]])
+    if filters.get("start_date"):
+        add("date >= {}", [str(filters["start_date"])])
+    if filters.get("end_date"):
+        add("date <= {}", [str(filters["end_date"])])
+
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def query(table: str, select: str, filters=None, group_by: str = "", order_by: str = "", ctx=None):
+    """Run ``SELECT {select} FROM {table} [WHERE filters] [GROUP BY] [ORDER BY]`` and return a DataFrame."""
+    _ensure_table(table, ctx)
+    where, params = _where(filters or {}, table)
+    sql = f"SELECT {select} FROM {table}{where}"
+    if group_by:
+        sql += f" GROUP BY {group_by}"
+    if order_by:
+        sql += f" ORDER BY {order_by}"
+
+    with _lock:
+        return pd.read_sql_query(sql, _connection, params=params)
+
+
+def monthly_costs_by_category(filters=None, ctx=None):
+    return query(
+        "costs",
+        "strftime('%Y-%m', date) AS Month, category AS Category, SUM(amount) AS Cost",
+        filters, group_by="Month, Category", order_by="Month", ctx=ctx,
+    )
+
+
+def costs_by_category(filters=None, ctx=None):
+    return query(
+        "costs", "category AS Category, SUM(amount) AS Cost, COUNT(*) AS Transactions",
+        filters, group_by="category", order_by="Cost DESC", ctx=ctx,
+    )
+
+
+def cost_summary(filters=None, ctx=None):
+    """One row of Costs dashboard KPIs: total, transactions, categories,
+    distinct calendar months and the first and last date."""
+    return query(
+        "costs",
+        "COALESCE(SUM(amount), 0) AS Cost, COUNT(*) AS Transactions, COUNT(DISTINCT category) AS Categories, "
+        "COUNT(DISTINCT strftime('%m', date)) AS Months, MIN(date) AS First, MAX(date) AS Last",
+        filters, ctx=ctx,
+    ).iloc[0]
+
+
+def daily_costs(filters=None, ctx=None):
+    return query(
+        "costs", "date AS Date, SUM(amount) AS Cost",
+        filters, group_by="date", order_by="date", ctx=ctx,
+    )
+
+
+def revenue_by_customer(filters=None, ctx=None):
+    return query(
+        "sales",
+        "customer AS Customer, SUM(revenue) AS Revenue, SUM(quantity) AS Quantity, COUNT(*) AS Transactions",
+        filters, group_by="customer", order_by="Revenue DESC", ctx=ctx,
+    )
+
+
+def harvest_by_structure(filters=None, ctx=None):
+    return query(
+        "harvests", 'structure AS Greenhouse, SUM(quantity) AS "Total Volume"',
+        filters, group_by="structure", order_by='"Total Volume" DESC', ctx=ctx,
+    )
+
+
+def harvest_by_line(filters=None, ctx=None):
+    """Per greenhouse and line, the harvests that picked from the line: their
+    average and total volume and their count. Empty lines are left out."""
+    sums = ", ".join(
+        f"SUM(CASE WHEN line_{i} > 0 THEN line_{i} END) AS total_{i}, "
+        f"COUNT(CASE WHEN line_{i} > 0 THEN 1 END) AS count_{i}"
+        for i in range(1, 10)
+    )
+    wide = query("harvest_lines", f"structure AS Structure, {sums}", filters, group_by="structure", ctx=ctx)
+
+    lines = [
+        {
+            "Structure": row["Structure"],
+            "Line": f"Line {i}",
+            "Avg_Volume": row[f"total_{i}"] / row[f"count_{i}"],
+            "Harvest_Count": row[f"count_{i}"],
+            "Total_Volume": row[f"total_{i}"],
+        }
+        for _, row in wide.iterrows()
+        for i in range(1, 10)
+        if row[f"count_{i}"] > 0
+    ]
+    if not lines:
+        return pd.DataFrame()
+    return pd.DataFrame(lines).sort_values(["Structure", "Avg_Volume"], ascending=[True, False])
+
+
+def monthly_totals(table: str, filters=None, ctx=None):
+    """Monthly sums of the ``deposits`` or ``withdraws`` table."""
+    return query(
+        table, "strftime('%Y-%m', date) AS Month, SUM(amount) AS Amount",
+        filters, group_by="Month", order_by="Month", ctx=ctx,
+    )
@@ -0,0 +1,361 @@
+import json
+import sqlite3
+from abc import ABC, abstractmethod
+from contextlib import closing
+
+import pandas as pd
+import streamlit as st
+
+import mirror_functions as mfx
+import sheets_functions as shfx
+
+# Header words whose columns get an index in the SQLite backend (matches e.g.
+# "Customer/Destination", "Cost Category").
+INDEXED_HEADER_WORDS = ("customer", "category")
+
+# Date columns are kept as the sheet's text (dd/mm/yy, dd/Mon/yyyy, ...), which
+# does not sort by date, so each also gets an indexed ISO yyyy-mm-dd copy under
+# this suffix, e.g. "Date__iso". Reads leave the copies out.
+ISO_DATE_SUFFIX = "__iso"
+
+
+class StorageBackend(ABC):
+    """Where a workbook's tabs live. Tabs are grids of cells addressed like a
+    sheet: row 1 is the header and data rows keep their sheet row numbers."""
+
+    @abstractmethod
+    def read_values_batch(self, secret_name: str, requests, evaluate_formulas: bool = False):
+        """Same contract as shfx.batch_get_values: one grid per ``(title, start_row[, columns])``."""
+
+    @abstractmethod
+    def append_rows(self, secret_name: str, title: str, rows, first_data_row: int = 2) -> int:
+        """Append rows below the last filled row and return the first row written."""
+
+    @abstractmethod
+    def update_rows(self, secret_name: str, title: str, updates):
+        """Overwrite whole rows; ``updates`` maps sheet row number -> cell values."""
+
+    @abstractmethod
+    def update_cells(self, secret_name: str, title: str, cells):
+        """Overwrite single cells; ``cells`` maps (sheet row number, 0-based column) -> value."""
+
+    @abstractmethod
+    def get_revision(self, secret_name: str):
+        """A token that changes whenever the workbook does, or None if there is no cheap one."""
+
+
+class SheetsBackend(StorageBackend):
+    """Google Sheets, read through the local Parquet mirror when it is usable."""
+
+    def read_values_batch(self, secret_name, requests, evaluate_formulas=False):
+        return mfx.read_values_batch(secret_name, requests, evaluate_formulas)
+
+    def append_rows(self, secret_name, title, rows, first_data_row=2):
+        return shfx.append_rows(secret_name, title, rows, first_data_row=first_data_row)
+
+    def update_rows(self, secret_name, title, updates):
+        shfx.update_rows(secret_name, title, updates)
+
+    def update_cells(self, secret_name, title, cells):
+        shfx.update_cells(secret_name, title, cells)
+
+    def get_revision(self, secret_name):
+        return shfx.get_revision(secret_name)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tabs (
+    secret_name TEXT NOT NULL,
+    title TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    header_json TEXT NOT NULL,
+    columns_json TEXT NOT NULL,
+    revision INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (secret_name, title)
+);
+"""
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _is_date_column(name):
+    return "date" in name.casefold()
+
+
+def _iso_date(cell):
+    # Day first, as the sheets are written; blanks and text that is not a date stay NULL
+    if cell is None or not str(cell).strip():
+        return None
+    date = pd.to_datetime(str(cell), dayfirst=True, errors="coerce")
+    return None if pd.isna(date) else date.strftime("%Y-%m-%d")
+
+
+def _add_iso_column(connection, table_name, name):
+    iso_name = name + ISO_DATE_SUFFIX
+    connection.execute(f"ALTER TABLE {_quote(table_name)} ADD COLUMN {_quote(iso_name)} TEXT")
+    connection.execute(
+        f"CREATE INDEX {_quote(f'{table_name}__{iso_name}')} ON {_quote(table_name)} ({_quote(iso_name)})"
+    )
+
+
+def _column_names(header, width):
+    # Header text where usable, so the tables can be queried by name
+    names = []
+    for i in range(width):
+        name = str(header[i]).strip() if i < len(header) else ""
+        if not name or name.casefold() in (existing.casefold() for existing in names) or name.casefold() == "row":
+            name = f"column_{i + 1}"
+        names.append(name)
+    return names
+
+
+class SQLiteBackend(StorageBackend):
+    """Tabs kept in a local SQLite file, one table per tab with a ``row`` key.
+
+    Cells are stored as text, as the Sheets API returns them, so the loaders'
+    parsing and cleaning stays the same. Columns named like Customer or
+    Category are indexed, and Date columns get an indexed ISO copy (see
+    ``ISO_DATE_SUFFIX``). Use ``import_tabs`` to copy tabs over from Sheets.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path or st.secrets.get("storage_path", ".anjo_store.sqlite3"), timeout=10)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(_SCHEMA)
+        return connection
+
+    def _get_tab(self, connection, secret_name, title):
+        tab = connection.execute(
+            "SELECT table_name, header_json, columns_json FROM tabs WHERE secret_name = ? AND title = ?",
+            (secret_name, title),
+        ).fetchone()
+        if tab is None:
+            raise LookupError(f"No local table for {secret_name}/{title}; import it first")
+        return tab[0], json.loads(tab[1]), json.loads(tab[2])
+
+    def _backfill_iso_dates(self, connection, table_name, columns):
+        # Tables imported before the ISO copies existed get them on their first write
+        existing = {info[1] for info in connection.execute(f"PRAGMA table_info({_quote(table_name)})")}
+        for name in columns:
+            if not _is_date_column(name) or name + ISO_DATE_SUFFIX in existing:
+                continue
+            _add_iso_column(connection, table_name, name)
+            connection.executemany(
+                f"UPDATE {_quote(table_name)} SET {_quote(name + ISO_DATE_SUFFIX)} = ? WHERE row = ?",
+                [
+                    (_iso_date(cell), number)
+                    for number, cell in connection.execute(f"SELECT row, {_quote(name)} FROM {_quote(table_name)}")
+                ],
+            )
+
+    def _widen(self, connection, secret_name, title, width):
+        table_name, header, columns = self._get_tab(connection, secret_name, title)
+        self._backfill_iso_dates(connection, table_name, columns)
+        if width <= len(columns):
+            return table_name, columns
+
+        new_columns = _column_names(header, width)[len(columns):]
+        for name in new_columns:
+            connection.execute(f"ALTER TABLE {_quote(table_name)} ADD COLUMN {_quote(name)} TEXT")
+            if _is_date_column(name):
+                _add_iso_column(connection, table_name, name)
+        columns = columns + new_columns
+        connection.execute(
+            "UPDATE tabs SET columns_json = ? WHERE secret_name = ? AND title = ?",
+            (json.dumps(columns), secret_name, title),
+        )
+        return table_name, columns
+
+    def _write(self, connection, table_name, columns, numbered_rows):
+        date_columns = [i for i, name in enumerate(columns) if _is_date_column(name)]
+        names = ["row"] + columns + [columns[i] + ISO_DATE_SUFFIX for i in date_columns]
+        records = []
+        for number, row in numbered_rows:
+            cells = [str(cell) for cell in row] + [None] * (len(columns) - len(row))
+            records.append([number] + cells + [_iso_date(cells[i]) for i in date_columns])
+        connection.executemany(
+            f"INSERT OR REPLACE INTO {_quote(table_name)} ({', '.join(map(_quote, names))}) "
+            f"VALUES ({', '.join('?' * len(names))})",
+            records,
+        )
+
+    def _bump(self, connection, secret_name, title):
+        connection.execute(
+            "UPDATE tabs SET revision = revision + 1 WHERE secret_name = ? AND title = ?",
+            (secret_name, title),
+        )
+
+    def create_tab(self, secret_name, title, values):
+        """(Re)create a tab from a full grid, header row first."""
+        header = values[0] if values else []
+        width = max((len(row) for row in values), default=0)
+        columns = _column_names(header, width)
+        table_name = "".join(c if c.isalnum() else "_" for c in f"{secret_name}__{title}")
+
+        with closing(self._connect()) as connection, connection:
+            connection.execute(f"DROP TABLE IF EXISTS {_quote(table_name)}")
+            connection.execute(
+                f"CREATE TABLE {_quote(table_name)} (row INTEGER PRIMARY KEY, "
+                + ", ".join(f"{_quote(name)} TEXT" for name in columns)
+                + ")"
+            )
+            for name in columns:
+                if any(word in name.casefold() for word in INDEXED_HEADER_WORDS):
+                    connection.execute(
+                        f"CREATE INDEX {_quote(f'{table_name}__{name}')} ON {_quote(table_name)} ({_quote(name)})"
+                    )
+                if _is_date_column(name):
+                    _add_iso_column(connection, table_name, name)
+            connection.execute(
+                "INSERT OR REPLACE INTO tabs (secret_name, title, table_name, header_json, columns_json, revision) "
+                "VALUES (?, ?, ?, ?, ?, COALESCE((SELECT revision + 1 FROM tabs WHERE secret_name = ? AND title = ?), 0))",
+                (secret_name, title, table_name, json.dumps(header), json.dumps(columns), secret_name, title),
+            )
+            self._write(connection, table_name, columns, enumerate(values[1:], start=2))
+
+    def get_table_name(self, secret_name, title):
+        with closing(self._connect()) as connection:
+            return self._get_tab(connection, secret_name, title)[0]
+
+    def read_values_batch(self, secret_name, requests, evaluate_formulas=False):
+        grids = []
+        with closing(self._connect()) as connection:
+            for request in requests:
+                title, start_row, columns = shfx.split_request(request)
+                try:
+                    table_name, header, stored_columns = self._get_tab(connection, secret_name, title)
+                except LookupError:
+                    grids.append([])
+                    continue
+
+                names = ", ".join(_quote(name) for name in ["row"] + stored_columns)
+                records = connection.execute(
+                    f"SELECT {names} FROM {_quote(table_name)} WHERE row >= ? ORDER BY row", (max(start_row, 2),)
+                ).fetchall()
+
+                grid = [list(header)] if start_row <= 1 else []
+                next_row = max(start_row, 2)
+                for number, *cells in records:
+                    # Keep row positions exact, as a sheet with blank rows would
+                    grid.extend([] for _ in range(number - next_row))
+                    while cells and cells[-1] in (None, ""):
+                        cells.pop()
+                    grid.append(["" if cell is None else cell for cell in cells])
+                    next_row = number + 1
+                grids.append(shfx.project_columns(grid, columns))
+
+        return grids
+
+    def append_rows(self, secret_name, title, rows, first_data_row=2):
+        rows = [list(row) for row in rows]
+        with closing(self._connect()) as connection, connection:
+            table_name, columns = self._widen(
+                connection, secret_name, title, max((len(row) for row in rows), default=0)
+            )
+            (last_row,) = connection.execute(f"SELECT MAX(row) FROM {_quote(table_name)}").fetchone()
+            next_row = max(first_data_row, (last_row or 1) + 1)
+            self._write(connection, table_name, columns, enumerate(rows, start=next_row))
+            self._bump(connection, secret_name, title)
+
+        return next_row
+
+    def update_rows(self, secret_name, title, updates):
+        with closing(self._connect()) as connection, connection:
+            table_name, columns = self._widen(
+                connection, secret_name, title, max((len(row) for row in updates.values()), default=0)
+            )
+            self._write(connection, table_name, columns, [(number, list(row)) for number, row in updates.items()])
+            self._bump(connection, secret_name, title)
+
+    def update_cells(self, secret_name, title, cells):
+        with closing(self._connect()) as connection, connection:
+            # Row 1 is the header, kept in the tabs table (new columns are named after it)
+            header_cells = {column: value for (number, column), value in cells.items() if number == 1}
+            if header_cells:
+                _, header, _ = self._get_tab(connection, secret_name, title)
+                header = header + [""] * (max(header_cells) + 1 - len(header))
+                for column, value in header_cells.items():
+                    header[column] = str(value)
+                connection.execute(
+                    "UPDATE tabs SET header_json = ? WHERE secret_name = ? AND title = ?",
+                    (json.dumps(header), secret_name, title),
+                )
+
+            table_name, columns = self._widen(
+                connection, secret_name, title, max((column + 1 for _, column in cells), default=0)
+            )
+            for (number, column), value in cells.items():
+                if number == 1:
+                    continue
+                connection.execute(f"INSERT OR IGNORE INTO {_quote(table_name)} (row) VALUES (?)", (number,))
+                name = columns[column]
+                connection.execute(
+                    f"UPDATE {_quote(table_name)} SET {_quote(name)} = ? WHERE row = ?",
+                    (str(value), number),
+                )
+                if _is_date_column(name):
+                    connection.execute(
+                        f"UPDATE {_quote(table_name)} SET {_quote(name + ISO_DATE_SUFFIX)} = ? WHERE row = ?",
+                        (_iso_date(value), number),
+                    )
+            self._bump(connection, secret_name, title)
+
+    def get_revision(self, secret_name):
+        with closing(self._connect()) as connection:
+            return connection.execute(
+                "SELECT COALESCE(SUM(revision), 0) FROM tabs WHERE secret_name = ?", (secret_name,)
+            ).fetchone()[0]
+
+
+_backends = {"sheets": SheetsBackend(), "sqlite": SQLiteBackend()}
+
+
+def get_backend_name(secret_name: str) -> str:
+    """Backend of a workbook: "sheets" unless set in a [storage_backends] secrets table."""
+    return st.secrets.get("storage_backends", {}).get(secret_name, "sheets")
+
+
+def get_backend(secret_name: str) -> StorageBackend:
+    return _backends[get_backend_name(secret_name)]
+
+
+def read_values_batch(secret_name: str, requests, evaluate_formulas: bool = False):
+    return get_backend(secret_name).read_values_batch(secret_name, requests, evaluate_formulas)
+
+
+def read_values(secret_name: str, title: str, start_row: int = 1, evaluate_formulas: bool = False):
+    return read_values_batch(secret_name, [(title, start_row)], evaluate_formulas)[0]
+
+
+def append_rows(secret_name: str, title: str, rows, first_data_row: int = 2) -> int:
+    return get_backend(secret_name).append_rows(secret_name, title, rows, first_data_row)
+
+
+def update_rows(secret_name: str, title: str, updates):
+    get_backend(secret_name).update_rows(secret_name, title, updates)
+
+
+def update_cells(secret_name: str, title: str, cells):
+    get_backend(secret_name).update_cells(secret_name, title, cells)
+
+
+def get_revision(secret_name: str):
+    return get_backend(secret_name).get_revision(secret_name)
+
+
+def import_tabs(*datasets):
+    """Copy the tabs of the given datasets (all of them by default) from Google
+    Sheets into the SQLite backend, replacing what it held.
+
+    Run once before pointing a workbook at "sqlite" in [storage_backends].
+    """
+    sqlite_backend = _backends["sqlite"]
+    for dataset in datasets or mfx.MIRRORED_TABS:
+        for secret_name, title, evaluate_formulas in mfx.MIRRORED_TABS[dataset]:
+            values = shfx.get_values(secret_name, title, evaluate_formulas=evaluate_formulas)
+            sqlite_backend.create_tab(secret_name, title, values)
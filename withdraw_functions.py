@@ -1,20 +1,21 @@
-import datetime
 from typing import List
 
-import gspread
 import pandas as pd
 import streamlit as st
-from gspread_dataframe import get_as_dataframe
 
+import cache_functions as cachefx
+import sql_functions as sqlfx
 
+
+@cachefx.cached("withdraws", snapshot=1, schema={"Date": "datetime64[ns]", "Amount": "float64"})
 def load_withdraws():
-    sheet_credentials = st.secrets["sheet_credentials"]
-    gc = gspread.service_account_from_dict(sheet_credentials)
+    return cachefx.load_tab("sheet_key", "Withdraws")
+
+
+sqlfx.register_table("withdraws", load_withdraws, date="Date", amount="Amount")
 
-    pepper_workbook = gc.open_by_key(st.secrets["sheet_key"])
-    deposits_sheet = pepper_workbook.worksheet("Withdraws")
-    withdraw_df = get_as_dataframe(deposits_sheet, parse_dates=True)
 
+def clean_withdraws_df(withdraw_df):
     withdraw_df.drop(columns=["Timestamp"], inplace=True)
     withdraw_df['Date'] = pd.to_datetime(withdraw_df['Date'], format='%d/%b/%Y')
 
@@ -23,6 +24,9 @@ def load_withdraws():
     return result
 
 
+cachefx.register_tab("withdraws", "sheet_key", "Withdraws", clean_withdraws_df, tombstones=True, parse_dates=True)
+
+
 def format_date(input_date):
     # Convert the input string to a datetime object
     # date_object = datetime.strptime(input_date, '%d/%m/%y')
@@ -89,13 +93,11 @@ def filter_data(data: pd.DataFrame, filter_name: str, values: List[str]) -> pd.D
         data = data[data['Date'].dt.month.isin(values)]
 
     if filter_name == "start_date":
-        date_string = str(values)
-        formatted_start_date = datetime.datetime.strptime(date_string, "%Y-%m-%d").strftime("%d/%m/%Y")
-        data = data[data['Date'] >= formatted_start_date]
+        # Compared as dates, like sqlfx's WHERE clause (not as dd/mm/yyyy text)
+        data = data[data['Date'] >= pd.Timestamp(str(values))]
 
     if filter_name == "end_date":
-        date_string = str(values)
-        formatted_start_date = datetime.datetime.strptime(date_string, "%Y-%m-%d").strftime("%d/%m/%Y")
-        data = data[data['Date'] <= formatted_start_date]
+        # The whole end day counts, times included
+        data = data[data['Date'] < pd.Timestamp(str(values)) + pd.Timedelta(days=1)]
 
     return data